@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'user.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
@@ -83,11 +84,45 @@ WSGI_APPLICATION = 'ingressou_back.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.0/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# DB_ENGINE=postgresql usa o PostgreSQL com conexões persistentes (DB_CONN_MAX_AGE segundos) e
+# verificação de saúde antes de reutilizá-las (requer o psycopg do requirements.txt). Sem configuração,
+# continua no SQLite local, que é aberto em modo WAL (ver user.signals.configurar_sqlite)
+DB_ENGINE = config('DB_ENGINE', default='sqlite3')
+
+if DB_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DB_NAME', default='ingressou'),
+            'USER': config('DB_USER', default='postgres'),
+            'PASSWORD': config('DB_PASSWORD', default=''),
+            'HOST': config('DB_HOST', default='localhost'),
+            'PORT': config('DB_PORT', default='5432'),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+            'OPTIONS': {
+                'connect_timeout': config('DB_CONNECT_TIMEOUT', default=5, cast=int),
+            },
+        }
     }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DB_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=0, cast=int),
+            'OPTIONS': {
+                # Segundos que uma escrita espera pelo lock antes de "database is locked"
+                'timeout': config('SQLITE_BUSY_TIMEOUT', default=20, cast=int),
+            },
+        }
+    }
+
+# journal_mode fica gravado no arquivo do banco e é aplicado uma vez por processo; os PRAGMAs de
+# SQLITE_PRAGMAS valem só para a conexão e são aplicados em cada nova conexão SQLite
+SQLITE_JOURNAL_MODE = config('SQLITE_JOURNAL_MODE', default='WAL')
+SQLITE_PRAGMAS = {
+    'synchronous': config('SQLITE_SYNCHRONOUS', default='NORMAL'),
 }
 
 # Password validation
@@ -108,6 +143,38 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Hasher usado para novas senhas ('pbkdf2', 'scrypt' ou 'argon2', que requer argon2-cffi). Os demais
+# continuam na lista para validar senhas antigas, que são regravadas com o hasher escolhido no login
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = config('PASSWORD_PBKDF2_ITERATIONS', default=720000, cast=int)
+PASSWORD_SCRYPT_WORK_FACTOR = config('PASSWORD_SCRYPT_WORK_FACTOR', default=2 ** 14, cast=int)
+PASSWORD_SCRYPT_BLOCK_SIZE = config('PASSWORD_SCRYPT_BLOCK_SIZE', default=8, cast=int)
+PASSWORD_SCRYPT_PARALLELISM = config('PASSWORD_SCRYPT_PARALLELISM', default=1, cast=int)
+PASSWORD_ARGON2_TIME_COST = config('PASSWORD_ARGON2_TIME_COST', default=2, cast=int)
+PASSWORD_ARGON2_MEMORY_COST = config('PASSWORD_ARGON2_MEMORY_COST', default=102400, cast=int)
+PASSWORD_ARGON2_PARALLELISM = config('PASSWORD_ARGON2_PARALLELISM', default=8, cast=int)
+
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'user.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'user.hashers.TunedScryptPasswordHasher',
+    'argon2': 'user.hashers.TunedArgon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    hasher for nome, hasher in _PASSWORD_HASHERS.items() if nome != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+# Limite de tentativas de login com falha por CPF e por IP, em uma janela deslizante. As contagens
+# ficam no cache padrão: com mais de um worker é preciso o cache compartilhado (CACHE_URL), senão
+# cada processo conta separado e o limite real é multiplicado pelo número de workers.
+# LOGIN_PROXIES_CONFIAVEIS é a quantidade de proxies reversos na frente da aplicação: o IP do cliente
+# é o endereço que o mais externo deles acrescentou ao X-Forwarded-For (0 = usa REMOTE_ADDR)
+LOGIN_LIMITE_CPF = config('LOGIN_LIMITE_CPF', default=5, cast=int)
+LOGIN_LIMITE_IP = config('LOGIN_LIMITE_IP', default=50, cast=int)
+LOGIN_JANELA_SEGUNDOS = config('LOGIN_JANELA_SEGUNDOS', default=300, cast=int)
+LOGIN_PROXIES_CONFIAVEIS = config('LOGIN_PROXIES_CONFIAVEIS', default=0, cast=int)
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -137,6 +204,11 @@ EMAIL_USE_TLS = True
 EMAIL_HOST_USER = config('EMAIL_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_PASS')
 DEFAULT_FROM_EMAIL = config('EMAIL_USER')
+EMAIL_TIMEOUT = config('EMAIL_TIMEOUT', default=30, cast=int)
+
+# Fila de e-mails (user.emails): tentativas antes de desistir e atraso base do backoff exponencial
+EMAIL_MAX_TENTATIVAS = config('EMAIL_MAX_TENTATIVAS', default=5, cast=int)
+EMAIL_BACKOFF_SEGUNDOS = config('EMAIL_BACKOFF_SEGUNDOS', default=30, cast=int)
 
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
@@ -167,6 +239,108 @@ CORS_ALLOW_METHODS = (
     "PUT",
 )
 
+# Cache compartilhado entre os processos (tokens, limites de login, CPFs, pagamento atual). Com mais
+# de um worker, CACHE_URL deve apontar para um Redis (ex.: redis://localhost:6379/0): sem ele cada
+# processo tem o seu LocMemCache, e invalidações e limites de tentativas não valem entre workers
+# (manage.py check --deploy avisa)
+CACHE_URL = config('CACHE_URL', default='')
+if CACHE_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Cache dos QR Codes dos ingressos: 'user.gerar_qrcode.LRUQrCodeCache' (memória do processo)
+# ou 'user.gerar_qrcode.DjangoQrCodeCache' (usa o cache configurado em CACHES). Com CACHE_URL o
+# padrão é o compartilhado, que manage.py precalcular_qrcodes consegue aquecer para todos os workers
+QRCODE_CACHE_BACKEND = config(
+    'QRCODE_CACHE_BACKEND',
+    default='user.gerar_qrcode.DjangoQrCodeCache' if CACHE_URL else 'user.gerar_qrcode.LRUQrCodeCache',
+)
+# Segundos que cada QR Code fica no cache compartilhado (sem limite de tamanho, as entradas
+# precisam expirar) e se só a renderização padrão é guardada nele; rode precalcular_qrcodes
+# dentro desse prazo antes do evento
+QRCODE_CACHE_TIMEOUT = config('QRCODE_CACHE_TIMEOUT', default=86400, cast=int)
+QRCODE_CACHE = {
+    'BACKEND': QRCODE_CACHE_BACKEND,
+    'OPTIONS': {
+        'max_size': config('QRCODE_CACHE_MAX_SIZE', default=10000, cast=int),
+    } if QRCODE_CACHE_BACKEND.endswith('LRUQrCodeCache') else {
+        'alias': config('QRCODE_CACHE_ALIAS', default='default'),
+        'timeout': QRCODE_CACHE_TIMEOUT,
+        'somente_padrao': config('QRCODE_CACHE_SOMENTE_PADRAO', default=True, cast=bool),
+    },
+}
+
+# Processos usados para gerar QR Codes em lote (None = min(4, CPUs)) e
+# tamanho mínimo do lote para valer a pena distribuir entre processos
+QRCODE_WORKERS = config('QRCODE_WORKERS', default=None, cast=lambda v: None if v is None else int(v))
+QRCODE_LOTE_MINIMO = config('QRCODE_LOTE_MINIMO', default=8, cast=int)
+
+# Quantidade máxima de leituras aceitas por chamada de validação em lote
+VALIDACAO_LOTE_MAXIMO = config('VALIDACAO_LOTE_MAXIMO', default=1000, cast=int)
+
+# Tamanho padrão das páginas das listagens paginadas por cursor
+PAGINACAO_TAMANHO_PAGINA = config('PAGINACAO_TAMANHO_PAGINA', default=50, cast=int)
+
+# Quantidade máxima de ingressos em uma única compra
+INGRESSOS_POR_PEDIDO_MAXIMO = config('INGRESSOS_POR_PEDIDO_MAXIMO', default=20, cast=int)
+
+# Tempo (segundos) que uma reserva segura os ingressos de um lote antes de voltarem ao estoque
+RESERVA_VALIDADE = config('RESERVA_VALIDADE', default=10 * 60, cast=int)
+
+# Ingressos que um mesmo usuário pode segurar ao mesmo tempo, somando as suas reservas ativas
+RESERVA_MAXIMO_POR_USUARIO = config('RESERVA_MAXIMO_POR_USUARIO', default=INGRESSOS_POR_PEDIDO_MAXIMO, cast=int)
+
+# Chaves Idempotency-Key da compra: a resposta gravada é devolvida nas repetições por
+# IDEMPOTENCIA_VALIDADE segundos
+IDEMPOTENCIA_VALIDADE = config('IDEMPOTENCIA_VALIDADE', default=24 * 60 * 60, cast=int)
+
+# Cache da consulta de CPF da tela de login (validate_cpf). CPFs sem usuário também são guardados,
+# por menos tempo; alterações no usuário invalidam a entrada, mas sem CACHE_URL só no processo que
+# fez a alteração: os outros respondem com o valor antigo até expirar, por isso os prazos curtos
+CPF_CACHE_TIMEOUT = config('CPF_CACHE_TIMEOUT', default=300 if CACHE_URL else 10, cast=int)
+CPF_CACHE_NEGATIVO_TIMEOUT = config('CPF_CACHE_NEGATIVO_TIMEOUT', default=60 if CACHE_URL else 5, cast=int)
+
+# Tempo (segundos) que o pagamento atual exibido fica em cache; alterações no Pagamento invalidam antes
+# disso, mas só no cache compartilhado: sem CACHE_URL os outros processos só veem ao expirar. A compra
+# sempre lê o preço do banco
+PAGAMENTO_CACHE_TIMEOUT = config('PAGAMENTO_CACHE_TIMEOUT', default=300 if CACHE_URL else 30, cast=int)
+
+# Cache da autenticação por token. O cache compartilhado é invalidado quando o token é removido ou o
+# usuário é alterado; o LRU de cada processo expira em TOKEN_CACHE_LOCAL_TIMEOUT segundos, que é o
+# atraso máximo para outros processos perceberem um token removido ou um usuário desativado. Sem
+# CACHE_URL o nível "compartilhado" também é de cada processo, então ele expira no mesmo prazo
+TOKEN_CACHE_TIMEOUT = config('TOKEN_CACHE_TIMEOUT', default=300 if CACHE_URL else 30, cast=int)
+TOKEN_CACHE_LOCAL_TIMEOUT = config('TOKEN_CACHE_LOCAL_TIMEOUT', default=30, cast=int)
+TOKEN_CACHE_MAX_SIZE = config('TOKEN_CACHE_MAX_SIZE', default=10000, cast=int)
+
+# Tokens de acesso: expiram após TOKEN_VALIDADE segundos sem uso; o último uso só é gravado de
+# TOKEN_RENOVACAO_INTERVALO em TOKEN_RENOVACAO_INTERVALO segundos, e cada usuário mantém no máximo
+# TOKEN_MAX_POR_USUARIO tokens (os mais antigos são descartados no login)
+TOKEN_VALIDADE = config('TOKEN_VALIDADE', default=30 * 24 * 60 * 60, cast=int)
+TOKEN_RENOVACAO_INTERVALO = config('TOKEN_RENOVACAO_INTERVALO', default=5 * 60, cast=int)
+TOKEN_MAX_POR_USUARIO = config('TOKEN_MAX_POR_USUARIO', default=5, cast=int)
+
+# Snapshot de ingressos para validação offline nos leitores da portaria. Os leitores recebem a
+# SNAPSHOT_SIGNING_KEY para conferir a assinatura, então ela é exclusiva deles (nunca o SECRET_KEY);
+# sem ela os endpoints de snapshot falham
+SNAPSHOT_SIGNING_KEY = config('SNAPSHOT_SIGNING_KEY', default='')
+SNAPSHOT_MARGEM_SEGUNDOS = config('SNAPSHOT_MARGEM_SEGUNDOS', default=10, cast=int)
+
+# Métricas por endpoint (Server-Timing e /metrics no formato do Prometheus). /metrics só responde
+# com METRICAS_TOKEN definido, e exige o cabeçalho "Authorization: Bearer <token>"
+METRICAS_ATIVAS = config('METRICAS_ATIVAS', default=True, cast=bool)
+METRICAS_TOKEN = config('METRICAS_TOKEN', default='')
+
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Ingressou API',
     'DESCRIPTION': 'Ingressou é um projeto de código aberto',
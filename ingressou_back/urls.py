@@ -19,16 +19,26 @@ from django.urls import path
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 from rest_framework import routers
 
-from user.apis.viewsets import UserViewSet, IngressoViewSet, PagamentoViewSet
+from user.apis import async_views
+from user.apis.viewsets import UserViewSet, IngressoViewSet, PagamentoViewSet, PedidoViewSet
+from user.metricas import metricas
 
 router = routers.SimpleRouter()
 router.register(r"api/user", UserViewSet)
 router.register(r"api/ingresso", IngressoViewSet)
 router.register(r"api/pagamento", PagamentoViewSet, basename='pagamento')
+router.register(r"api/pedido", PedidoViewSet, basename='pedido')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/schema/', SpectacularAPIView.as_view(), name='schema'),
     path('api/swagger/', SpectacularSwaggerView.as_view(url_name='schema'), name='swagger-ui'),
     path('api/redoc/', SpectacularRedocView.as_view(url_name='schema'), name='redoc'),
+    path('metrics/', metricas, name='metricas'),
+
+    # Versões assíncronas (ASGI) dos endpoints mais acessados
+    path('api/async/user/login/', async_views.login, name='async-login'),
+    path('api/async/ingresso/validate/', async_views.validate, name='async-validate'),
+    path('api/async/ingresso/meus_ingressos/', async_views.meus_ingressos, name='async-meus-ingressos'),
+    path('api/async/pagamento/atual/', async_views.pagamento_atual, name='async-pagamento-atual'),
 ] + router.urls
@@ -1,20 +1,113 @@
+import base64
+import zipfile
+from io import BytesIO
+
+from django import forms
 from django.contrib import admin
+from django.http import HttpResponse
 
-from user.models import Usuario, Ingresso, Pagamento
+from user.cpf import validar_cpf
+from user.gerar_qrcode import obter_qr_codes
+from user.models import Usuario, Ingresso, Pagamento, TokenAcesso, EmailPendente, Evento, Lote, Reserva, \
+    ChaveIdempotencia, Pedido, LancamentoPix
 
 
 # Register your models here.
 
+class UsuarioAdminForm(forms.ModelForm):
+
+    class Meta:
+        model = Usuario
+        fields = '__all__'
+
+    def clean_cpf(self):
+        # Como no cadastro pela API: só CPFs novos ou alterados passam pela verificação dos dígitos
+        cpf = self.cleaned_data['cpf']
+        if 'cpf' in self.changed_data:
+            validar_cpf(cpf)
+        return cpf
+
+
 @admin.register(Usuario)
 class UsuarioAdmin(admin.ModelAdmin):
     list_display = ('cpf', 'email', 'tipo')
+    form = UsuarioAdminForm
 
 
 @admin.register(Ingresso)
 class IngressoAdmin(admin.ModelAdmin):
     list_display = ('usuario', 'created_at')
+    list_select_related = ('usuario',)
+    actions = ['exportar_qr_codes']
+
+    @admin.action(description="Exportar QR Codes selecionados (ZIP)")
+    def exportar_qr_codes(self, request, queryset):
+        ingressos = list(queryset.values_list('pk', flat=True))
+        qr_codes = obter_qr_codes(ingressos)
+
+        buffered = BytesIO()
+        with zipfile.ZipFile(buffered, 'w', zipfile.ZIP_STORED) as arquivo:
+            for ingresso_pk, qr_code in zip(ingressos, qr_codes):
+                arquivo.writestr(f'{ingresso_pk}.png', base64.b64decode(qr_code))
+
+        response = HttpResponse(buffered.getvalue(), content_type='application/zip')
+        response['Content-Disposition'] = 'attachment; filename="qrcodes.zip"'
+        return response
 
 
 @admin.register(Pagamento)
 class PagamentoAdmin(admin.ModelAdmin):
     list_display = ('chave', 'valor')
+
+
+@admin.register(TokenAcesso)
+class TokenAcessoAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'emitido_em', 'ultimo_uso')
+    list_select_related = ('usuario',)
+
+
+@admin.register(EmailPendente)
+class EmailPendenteAdmin(admin.ModelAdmin):
+    list_display = ('assunto', 'status', 'tentativas', 'proxima_tentativa', 'created_at')
+    list_filter = ('status',)
+
+
+@admin.register(Evento)
+class EventoAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'data')
+
+
+@admin.register(Lote)
+class LoteAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'evento', 'capacidade', 'disponivel')
+    list_select_related = ('evento',)
+    # Alterado apenas pelas reservas e compras, com UPDATEs condicionais
+    readonly_fields = ('disponivel',)
+
+
+@admin.register(Reserva)
+class ReservaAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'lote', 'quantidade', 'status', 'expira_em')
+    list_select_related = ('usuario', 'lote__evento')
+    list_filter = ('status',)
+
+
+@admin.register(ChaveIdempotencia)
+class ChaveIdempotenciaAdmin(admin.ModelAdmin):
+    list_display = ('usuario', 'chave', 'rota', 'status', 'status_code', 'created_at')
+    list_select_related = ('usuario',)
+    list_filter = ('status',)
+
+
+@admin.register(Pedido)
+class PedidoAdmin(admin.ModelAdmin):
+    list_display = ('txid', 'usuario', 'valor', 'status', 'valor_pago', 'pago_em', 'created_at')
+    list_select_related = ('usuario',)
+    list_filter = ('status',)
+    search_fields = ('txid',)
+
+
+@admin.register(LancamentoPix)
+class LancamentoPixAdmin(admin.ModelAdmin):
+    list_display = ('txid', 'valor', 'horario', 'created_at')
+    search_fields = ('txid',)
@@ -0,0 +1,103 @@
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework import status
+
+from user.apis.serializers import ValidateIngressoSerializer, QrCodeFormatoSerializer, LoginSerializer, \
+    PagamentoSerializer
+from user.authentication import autenticar_async
+from user.gerar_qrcode import obter_qr_codes
+from user.login import TentativaLogin
+from user.models import Ingresso, UserType
+from user.pagamento import get_pagamento_atual
+
+# Versões assíncronas dos endpoints mais acessados, para rodar sob um servidor ASGI
+# (ex.: uvicorn ingressou_back.asgi:application). Enquanto esperam o banco ou o
+# cache, não prendem um worker; a renderização dos QR Codes roda fora do event loop.
+
+
+def _resposta(dados, status=status.HTTP_200_OK):
+    return JsonResponse(dados, status=status, safe=False, encoder=DjangoJSONEncoder)
+
+
+def _nao_autenticado():
+    return _resposta({'detail': 'As credenciais de autenticação não foram fornecidas.'},
+                     status=status.HTTP_401_UNAUTHORIZED)
+
+
+def _dados(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+
+
+@csrf_exempt
+@require_POST
+async def validate(request):
+    usuario = await autenticar_async(request)
+    if usuario is None:
+        return _nao_autenticado()
+    if usuario.tipo == UserType.COMUM:
+        return _resposta({}, status=status.HTTP_401_UNAUTHORIZED)
+
+    serializer = ValidateIngressoSerializer(data=_dados(request))
+    if not serializer.is_valid():
+        return _resposta(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    ingresso_id = serializer.validated_data['ingresso']
+
+    agora = timezone.now()
+    autorizado = await Ingresso.objects.filter(id=ingresso_id, utilizado_em__isnull=True) \
+        .aupdate(utilizado_em=agora, atualizado_em=agora)
+    if autorizado:
+        return _resposta({"msg": "Ingresso autorizado"})
+
+    if not await Ingresso.objects.filter(id=ingresso_id).aexists():
+        return _resposta({'detail': 'Não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+    return _resposta({"msg": "Ingresso já utilizado"}, status=status.HTTP_400_BAD_REQUEST)
+
+
+@require_GET
+async def meus_ingressos(request):
+    usuario = await autenticar_async(request)
+    if usuario is None:
+        return _nao_autenticado()
+
+    formato = QrCodeFormatoSerializer(data=request.GET)
+    if not formato.is_valid():
+        return _resposta(formato.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    ingressos = [pk async for pk in Ingresso.objects.filter(usuario=usuario).values_list('pk', flat=True)]
+    # CPU: vai para uma thread (e, em lotes grandes, para o pool de processos)
+    qr_codes = await sync_to_async(obter_qr_codes, thread_sensitive=False)(ingressos, **formato.validated_data)
+    return _resposta({"ingressos": qr_codes})
+
+
+@csrf_exempt
+@require_POST
+async def login(request):
+    serializer = LoginSerializer(data=_dados(request))
+    if not serializer.is_valid():
+        return _resposta(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    dados, status_code, headers = await TentativaLogin(request, serializer.validated_data).aexecutar()
+    response = _resposta(dados, status=status_code)
+    for cabecalho, valor in headers.items():
+        response[cabecalho] = valor
+    return response
+
+
+@require_GET
+async def pagamento_atual(request):
+    usuario = await autenticar_async(request)
+    if usuario is None:
+        return _nao_autenticado()
+
+    pagamento = await sync_to_async(get_pagamento_atual)()
+    if pagamento is None:
+        return _resposta({'detail': 'Não encontrado.'}, status=status.HTTP_404_NOT_FOUND)
+    return _resposta(PagamentoSerializer(pagamento).data)
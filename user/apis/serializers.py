@@ -1,7 +1,14 @@
+from django.conf import settings
+from django.db import transaction
 from rest_framework import serializers
 from rest_framework.authtoken.admin import User
 
-from user.models import Ingresso, Pagamento
+from user.exportar import FORMATOS as FORMATOS_EXPORTACAO, FORMATO_CSV
+from user.cpf import normalizar_cpf, validar_cpf
+from user.estoque import retirar_do_estoque, confirmar_reserva
+from user.gerar_qrcode import FORMATOS, FORMATO_PNG
+from user.models import Ingresso, Pagamento, ValidationStatus, Lote, Reserva, Pedido
+from user.pagamento import buscar_pagamento_atual
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -21,6 +28,12 @@ class UserSerializer(serializers.ModelSerializer):
             'is_primeiro_acesso'
         ]
 
+    def validate_cpf(self, value):
+        # Só CPFs novos ou alterados: usuários antigos podem ter CPFs que não passam na verificação
+        if self.instance is None or value != self.instance.cpf:
+            validar_cpf(value)
+        return value
+
 
 class IngressoSerializer(serializers.ModelSerializer):
     usuario = UserSerializer(read_only=True)
@@ -34,10 +47,12 @@ class IngressoSerializer(serializers.ModelSerializer):
             'nome',
             'data_nascimento',
             'situacao',
+            'pedido',
             'created_at',
             'utilizado_em'
         ]
         extra_kwargs = {
+            'pedido': {'read_only': True},
             'created_at': {'read_only': True},
             'utilizado_em': {'read_only': True},
         }
@@ -51,6 +66,37 @@ class ValidateIngressoSerializer(serializers.Serializer):
     ingresso = serializers.UUIDField(required=True)
 
 
+class LeituraIngressoSerializer(serializers.Serializer):
+    ingresso = serializers.UUIDField(required=True)
+    lido_em = serializers.DateTimeField(required=False)
+
+
+class ValidateIngressoLoteSerializer(serializers.Serializer):
+    leituras = LeituraIngressoSerializer(many=True, allow_empty=False,
+                                         max_length=settings.VALIDACAO_LOTE_MAXIMO)
+
+
+class ResultadoValidacaoSerializer(serializers.Serializer):
+    ingresso = serializers.UUIDField()
+    status = serializers.ChoiceField(choices=ValidationStatus.TYPES)
+    utilizado_em = serializers.DateTimeField(allow_null=True)
+
+
+class SnapshotSerializer(serializers.Serializer):
+    evento = serializers.UUIDField(required=False)
+
+
+class SnapshotDeltaSerializer(SnapshotSerializer):
+    cursor = serializers.DateTimeField(required=True, input_formats=['iso-8601'])
+
+
+class ExportarIngressosSerializer(serializers.Serializer):
+    formato = serializers.ChoiceField(choices=FORMATOS_EXPORTACAO, default=FORMATO_CSV)
+    utilizado_de = serializers.DateTimeField(required=False, input_formats=['%d/%m/%Y %H:%M:%S', 'iso-8601'])
+    utilizado_ate = serializers.DateTimeField(required=False, input_formats=['%d/%m/%Y %H:%M:%S', 'iso-8601'])
+    utilizados = serializers.BooleanField(allow_null=True, default=None)
+
+
 class GenerateIngressoSerializer(serializers.Serializer):
     usuario = serializers.SlugRelatedField(queryset=User.objects.all(), slug_field='cpf', required=True)
     nome = serializers.CharField(required=True)
@@ -68,28 +114,104 @@ class UserIngressoSerializer(serializers.Serializer):
 
 
 class PaymentIngressoSerializer(serializers.Serializer):
-    ingressos = UserIngressoSerializer(many=True)
+    ingressos = UserIngressoSerializer(many=True, allow_empty=False,
+                                       max_length=settings.INGRESSOS_POR_PEDIDO_MAXIMO)
+    lote = serializers.UUIDField(required=False)
+    reserva = serializers.UUIDField(required=False)
+
+    def validate(self, attrs):
+        if attrs.get('lote') and attrs.get('reserva'):
+            raise serializers.ValidationError("Informe o lote ou a reserva, não os dois.")
+        # Compra sem lote não passa pelo estoque: só é aceita enquanto nenhum lote foi cadastrado
+        if not attrs.get('lote') and not attrs.get('reserva') and Lote.objects.exists():
+            raise serializers.ValidationError({'lote': ["Informe o lote ou a reserva."]})
+        attrs['pagamento'] = buscar_pagamento_atual()
+        if attrs['pagamento'] is None:
+            raise serializers.ValidationError("Nenhum pagamento configurado: as vendas ainda não foram abertas.")
+        return attrs
 
     def create(self, validated_data):
-        ingressos = []
-        for ingresso_data in validated_data['ingressos']:
-            ingresso_data['usuario'] = self.context['request'].user
-            ingresso = Ingresso.objects.create(**ingresso_data)
-            ingressos.append(ingresso.pk)
+        usuario = self.context['request'].user
+        quantidade = len(validated_data['ingressos'])
+        lote_id = validated_data.get('lote')
+        with transaction.atomic():
+            if validated_data.get('reserva'):
+                lote_id = confirmar_reserva(validated_data['reserva'], usuario, quantidade)
+                if lote_id is None:
+                    raise serializers.ValidationError(
+                        {'reserva': ["Reserva inexistente, vencida ou menor que a compra."]}
+                    )
+
+            # O txid do pedido é o que liga o PIX recebido aos ingressos na conciliação
+            pagamento = validated_data['pagamento']
+            pedido = Pedido.objects.create(
+                usuario=usuario,
+                pagamento=pagamento,
+                valor=pagamento.valor * quantidade,
+            )
+            ingressos = Ingresso.objects.bulk_create([
+                Ingresso(usuario=usuario, lote_id=lote_id, pedido=pedido, **ingresso_data)
+                for ingresso_data in validated_data['ingressos']
+            ])
+
+            # Compra direta no lote: o estoque é retirado por último, perto do commit
+            if validated_data.get('lote') and not retirar_do_estoque(lote_id, quantidade):
+                raise serializers.ValidationError({'lote': [mensagem_lote_indisponivel(lote_id)]})
         return ingressos
 
 
+def mensagem_lote_indisponivel(lote_id):
+    return "Lote esgotado." if Lote.objects.filter(pk=lote_id).exists() else "Lote inexistente."
+
+
+class ReservarSerializer(serializers.Serializer):
+    lote = serializers.UUIDField(required=True)
+    quantidade = serializers.IntegerField(min_value=1, max_value=settings.INGRESSOS_POR_PEDIDO_MAXIMO)
+
+
+class ReservaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Reserva
+        fields = [
+            'id',
+            'lote',
+            'quantidade',
+            'status',
+            'expira_em',
+        ]
+
+
 class MeusIngressosSerializer(serializers.Serializer):
     ingressos = serializers.ListField()
 
 
+class QrCodeFormatoSerializer(serializers.Serializer):
+    formato = serializers.ChoiceField(choices=FORMATOS, default=FORMATO_PNG)
+    box_size = serializers.IntegerField(min_value=1, max_value=20, default=10)
+    border = serializers.IntegerField(min_value=0, max_value=8, default=4)
+
+
 class LoginSerializer(serializers.Serializer):
     cpf = serializers.CharField(required=True)
     password = serializers.CharField(required=True)
 
 
+class CpfField(serializers.CharField):
+    # Rejeita o que nem é um CPF antes de qualquer consulta ao banco. Os dígitos verificadores ficam
+    # para quem usa o campo: há usuários antigos cadastrados com CPFs que não passam na verificação
+    default_error_messages = {
+        'invalid_cpf': "CPF inválido.",
+    }
+
+    def to_internal_value(self, data):
+        cpf = normalizar_cpf(super().to_internal_value(data))
+        if cpf is None:
+            self.fail('invalid_cpf')
+        return cpf
+
+
 class ValidateCpfSerializer(serializers.Serializer):
-    cpf = serializers.CharField(required=True, write_only=True)
+    cpf = CpfField(required=True, write_only=True)
     primeiro_acesso = serializers.BooleanField(read_only=True, default=True)
 
 
@@ -108,7 +230,23 @@ class RedefinirSenhaSerializer(serializers.Serializer):
     new_password = serializers.CharField(required=True)
 
 
-class PagamentoSerializer(serializers.Serializer):
+class PedidoSerializer(serializers.ModelSerializer):
+    chave_pix = serializers.CharField(source='pagamento.chave', read_only=True, default=None)
+
+    class Meta:
+        model = Pedido
+        fields = [
+            'id',
+            'txid',
+            'chave_pix',
+            'valor',
+            'status',
+            'pago_em',
+            'created_at',
+        ]
+
+
+class PagamentoSerializer(serializers.ModelSerializer):
     class Meta:
         model = Pagamento
         fields = ['chave', 'valor']
@@ -1,33 +1,49 @@
-from django.contrib.auth import authenticate
+import base64
+
+from django.conf import settings
 from django.contrib.auth.hashers import make_password
-from django.core.mail import send_mail
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import Case, When, Value, DateTimeField
+from django.http import HttpResponse, Http404, StreamingHttpResponse
 from django.utils import timezone
 from django.utils.crypto import get_random_string
 
 from rest_framework import viewsets, status
-from rest_framework.authentication import TokenAuthentication
 from rest_framework.authtoken.admin import User
-from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response
 
 from user.apis.serializers import UserSerializer, IngressoSerializer, ValidateIngressoSerializer, LoginSerializer, \
     EsqueciSenhaSerializer, RedefinirSenhaSerializer, PagamentoSerializer, ValidateCpfSerializer, \
-    GenerateIngressoSerializer, FirstAccessSerializer, PaymentIngressoSerializer, MeusIngressosSerializer
+    GenerateIngressoSerializer, FirstAccessSerializer, PaymentIngressoSerializer, MeusIngressosSerializer, \
+    QrCodeFormatoSerializer, ValidateIngressoLoteSerializer, ResultadoValidacaoSerializer, SnapshotSerializer, \
+    SnapshotDeltaSerializer, ExportarIngressosSerializer, ReservarSerializer, ReservaSerializer, \
+    mensagem_lote_indisponivel, PedidoSerializer
+from user.cpf import get_primeiro_acesso, cpf_valido
+from user.estoque import criar_reserva, LimiteReservasExcedido
+from user.exportar import filtrar_ingressos, exportar_ingressos, CONTENT_TYPES
+from user.authentication import CachedTokenAuthentication
+from user.emails import enfileirar_email
 from user.filters import UserFilter
-from user.gerar_qrcode import gerar_qr_code_base64
-from user.models import Ingresso, UserType, Pagamento
+from user.pagination import CreatedAtCursorPagination, UsuarioCursorPagination
+from user.idempotencia import idempotente
+from user.login import TentativaLogin
+from user.gerar_qrcode import obter_qr_code, obter_qr_codes, FORMATO_PNG, FORMATO_SVG
+from user.metricas import MetricasViewSetMixin
+from user.models import Ingresso, UserType, Pagamento, Pedido, ValidationStatus
+from user.pagamento import get_pagamento_atual
+from user.snapshot import gerar_snapshot, gerar_delta
 
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     http_method_names = ['get', 'post', 'put', 'delete']
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     filterset_class = UserFilter
+    pagination_class = UsuarioCursorPagination
 
     def get_permissions(self):
         if self.action == 'list' or self.action == 'retrieve':  # Allow unauthenticated GET requests
@@ -47,9 +63,14 @@ class UserViewSet(viewsets.ModelViewSet):
         })
         if serializer.is_valid():
             cpf = serializer.validated_data['cpf']
-            user = get_object_or_404(User, cpf=cpf)
+            primeiro_acesso = get_primeiro_acesso(cpf)
+            if primeiro_acesso is None:
+                # Só depois da consulta (em cache): o CPF pode ser de um usuário antigo
+                if not cpf_valido(cpf):
+                    return Response({'cpf': ["CPF inválido."]}, status=status.HTTP_400_BAD_REQUEST)
+                raise Http404
             return Response({
-                "primeiro_acesso": user.is_primeiro_acesso
+                "primeiro_acesso": primeiro_acesso
             }, status=status.HTTP_200_OK)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -57,22 +78,8 @@ class UserViewSet(viewsets.ModelViewSet):
     def login(self, request, *args, **kwargs):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
-            cpf = serializer.validated_data['cpf']
-            password = serializer.validated_data['password']
-
-            user = authenticate(request, username=cpf, password=password)
-
-            if user is not None:
-                if not user.is_active:
-                    return Response({'error': 'User is inactive.'}, status=status.HTTP_400_BAD_REQUEST)
-
-                token, created = Token.objects.get_or_create(user=user)
-                return Response({
-                    'token': token.key,
-                    'tipo': user.tipo
-                })
-
-            return Response({'error': 'Invalid credentials.'}, status=status.HTTP_401_UNAUTHORIZED)
+            dados, status_code, headers = TentativaLogin(request, serializer.validated_data).executar()
+            return Response(dados, status=status_code, headers=headers)
 
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -112,19 +119,20 @@ class UserViewSet(viewsets.ModelViewSet):
                 user.is_primeiro_acesso = True
                 user.save()
 
-                send_mail(
+                # O envio é feito pelo worker da fila (manage.py enviar_emails), fora da requisição
+                enfileirar_email(
                     'Redefinição de senha ingressou',
                     f'Sua nova senha temporária é: {temp_password}. Por favor, altere-a no primeiro acesso.',
-                    'ingressou.olas@gmail.com',
                     [user.email],
-                    fail_silently=False,
+                    remetente='ingressou.olas@gmail.com',
                 )
                 return Response({'success': 'E-mail com senha temporária enviado'})
 
-
             except User.DoesNotExist:
                 return Response({'error': 'usuário não encontrado'}, status=status.HTTP_404_NOT_FOUND)
 
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=False, methods=['post'])
     def redefinir_senha(self, request, *args, **kwargs):
         serializer = RedefinirSenhaSerializer(data=request.data)
@@ -152,12 +160,13 @@ class UserViewSet(viewsets.ModelViewSet):
             pass
 
 
-class IngressoViewSet(viewsets.ModelViewSet):
+class IngressoViewSet(MetricasViewSetMixin, viewsets.ModelViewSet):
     queryset = Ingresso.objects.all()
     serializer_class = IngressoSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     http_method_names = ['get', 'post', 'put', 'delete']
+    pagination_class = CreatedAtCursorPagination
 
     def get_queryset(self):
         return self.request.user.ingressos.all()
@@ -170,15 +179,105 @@ class IngressoViewSet(viewsets.ModelViewSet):
         serializer.is_valid(raise_exception=True)
 
         ingresso_id = serializer.validated_data['ingresso']
-        ingresso = get_object_or_404(Ingresso, id=ingresso_id)
 
-        if ingresso.utilizado_em:
-            return Response({"msg": "Ingresso já utilizado"}, status=status.HTTP_400_BAD_REQUEST)
+        # UPDATE condicional: só um leitor consegue marcar o ingresso como utilizado
+        agora = timezone.now()
+        autorizado = Ingresso.objects.filter(id=ingresso_id, utilizado_em__isnull=True) \
+            .update(utilizado_em=agora, atualizado_em=agora)
+        if autorizado:
+            return Response({"msg": "Ingresso autorizado"}, status=status.HTTP_200_OK)
+
+        if not Ingresso.objects.filter(id=ingresso_id).exists():
+            raise Http404
+        return Response({"msg": "Ingresso já utilizado"}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=False, methods=['post'], serializer_class=ValidateIngressoLoteSerializer)
+    def validate_lote(self, request):
+        if self.request.user.tipo == UserType.COMUM:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        # Leituras reenviadas pelos leitores que ficaram offline: a mais antiga
+        # de cada ingresso vale, e nunca com horário no futuro
+        agora = timezone.now()
+        leituras = {}
+        for leitura in serializer.validated_data['leituras']:
+            lido_em = min(leitura.get('lido_em') or agora, agora)
+            ingresso_id = leitura['ingresso']
+            if ingresso_id not in leituras or lido_em < leituras[ingresso_id]:
+                leituras[ingresso_id] = lido_em
+
+        with transaction.atomic():
+            utilizados = dict(
+                Ingresso.objects.select_for_update()
+                .filter(pk__in=leituras.keys())
+                .values_list('pk', 'utilizado_em')
+            )
+            autorizar = {pk: leituras[pk] for pk, utilizado_em in utilizados.items() if utilizado_em is None}
+            if autorizar:
+                atualizados = Ingresso.objects.filter(pk__in=autorizar.keys(), utilizado_em__isnull=True).update(
+                    utilizado_em=Case(
+                        *[When(pk=pk, then=Value(lido_em)) for pk, lido_em in autorizar.items()],
+                        output_field=DateTimeField(),
+                    ),
+                    atualizado_em=agora,
+                )
+                if atualizados != len(autorizar):
+                    # Outro leitor validou parte desses ingressos entre o SELECT e o UPDATE
+                    utilizados.update(
+                        Ingresso.objects.filter(pk__in=autorizar.keys()).values_list('pk', 'utilizado_em')
+                    )
+                    autorizar = {pk: lido_em for pk, lido_em in autorizar.items() if utilizados[pk] == lido_em}
+                utilizados.update(autorizar)
+
+        resultados = []
+        for leitura in serializer.validated_data['leituras']:
+            ingresso_id = leitura['ingresso']
+            if ingresso_id not in utilizados:
+                situacao = ValidationStatus.DESCONHECIDO
+            elif autorizar.pop(ingresso_id, None):
+                situacao = ValidationStatus.AUTORIZADO
+            else:
+                situacao = ValidationStatus.UTILIZADO
+            resultados.append({
+                "ingresso": ingresso_id,
+                "status": situacao,
+                "utilizado_em": utilizados.get(ingresso_id),
+            })
+
+        response = ResultadoValidacaoSerializer(instance=resultados, many=True)
+        return Response(response.data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], serializer_class=SnapshotSerializer)
+    def snapshot(self, request):
+        if self.request.user.tipo == UserType.COMUM:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(gerar_snapshot(serializer.validated_data.get('evento')), status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], serializer_class=SnapshotDeltaSerializer)
+    def snapshot_delta(self, request):
+        if self.request.user.tipo == UserType.COMUM:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return Response(gerar_delta(serializer.validated_data['cursor'], serializer.validated_data.get('evento')),
+                        status=status.HTTP_200_OK)
 
-        ingresso.utilizado_em = timezone.now()
-        ingresso.save()
+    @action(detail=False, methods=['get'], serializer_class=ExportarIngressosSerializer, pagination_class=None)
+    def exportar(self, request):
+        if self.request.user.tipo == UserType.COMUM:
+            return Response(status=status.HTTP_401_UNAUTHORIZED)
+        serializer = self.get_serializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
 
-        return Response({"msg": "Ingresso autorizado"}, status=status.HTTP_200_OK)
+        formato = serializer.validated_data.pop('formato')
+        queryset = filtrar_ingressos(**serializer.validated_data)
+        response = StreamingHttpResponse(exportar_ingressos(queryset, formato), content_type=CONTENT_TYPES[formato])
+        response['Content-Disposition'] = f'attachment; filename="ingressos.{formato}"'
+        return response
 
     @action(detail=False, methods=['post'], serializer_class=GenerateIngressoSerializer)
     def generate(self, request):
@@ -191,29 +290,88 @@ class IngressoViewSet(viewsets.ModelViewSet):
         return Response(response.data, status=status.HTTP_201_CREATED)
 
     @action(detail=False, methods=['post'], serializer_class=PaymentIngressoSerializer)
+    @idempotente
     def payment(self, request):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        ingressos_pk = serializer.create(serializer.validated_data)
-        response = IngressoSerializer(many=True, instance=Ingresso.objects.filter(pk__in=ingressos_pk))
+        ingressos = serializer.create(serializer.validated_data)
+        response = IngressoSerializer(many=True, instance=ingressos)
         return Response(response.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=['post'], serializer_class=ReservarSerializer)
+    def reservar(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        lote_id = serializer.validated_data['lote']
+        try:
+            reserva = criar_reserva(lote_id, request.user, serializer.validated_data['quantidade'])
+        except LimiteReservasExcedido:
+            return Response({'quantidade': [
+                f"Limite de {settings.RESERVA_MAXIMO_POR_USUARIO} ingressos em reservas ativas por usuário."
+            ]}, status=status.HTTP_400_BAD_REQUEST)
+        if reserva is None:
+            return Response({'lote': [mensagem_lote_indisponivel(lote_id)]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(ReservaSerializer(instance=reserva).data, status=status.HTTP_201_CREATED)
+
     @action(detail=False, methods=['get'], serializer_class=MeusIngressosSerializer)
     def meus_ingressos(self, request):
-        ingressos = Ingresso.objects.filter(usuario=self.request.user)
+        formato = QrCodeFormatoSerializer(data=request.query_params)
+        formato.is_valid(raise_exception=True)
+
+        ingressos = Ingresso.objects.filter(usuario=self.request.user).values_list('pk', flat=True)
         data = {
-            "ingressos": [gerar_qr_code_base64(ingresso.pk) for ingresso in ingressos]
+            "ingressos": obter_qr_codes(ingressos, **formato.validated_data)
         }
         serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
         return Response(serializer.validated_data, status=status.HTTP_200_OK)
 
+    @action(detail=True, methods=['get'], serializer_class=QrCodeFormatoSerializer)
+    def qrcode(self, request, pk=None):
+        formato = self.get_serializer(data=request.query_params)
+        formato.is_valid(raise_exception=True)
+
+        ingresso = self.get_object()
+        qr_code = obter_qr_code(ingresso.pk, **formato.validated_data)
+
+        # Um único ingresso é entregue como imagem binária, sem o custo do base64
+        if formato.validated_data['formato'] == FORMATO_PNG:
+            return HttpResponse(base64.b64decode(qr_code), content_type='image/png')
+        if formato.validated_data['formato'] == FORMATO_SVG:
+            return HttpResponse(qr_code, content_type='image/svg+xml')
+        return Response(qr_code, status=status.HTTP_200_OK)
+
 
 class PagamentoViewSet(viewsets.ModelViewSet):
     serializer_class = PagamentoSerializer
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (CachedTokenAuthentication,)
     permission_classes = (IsAuthenticated,)
     http_method_names = ['get']
 
     def get_queryset(self):
         return Pagamento.objects.all().order_by('-created_at')[:1]
+
+    def list(self, request, *args, **kwargs):
+        pagamento = get_pagamento_atual()
+        serializer = self.get_serializer([pagamento] if pagamento else [], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def atual(self, request):
+        pagamento = get_pagamento_atual()
+        if pagamento is None:
+            raise Http404
+        serializer = self.get_serializer(pagamento)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+class PedidoViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = PedidoSerializer
+    authentication_classes = (CachedTokenAuthentication,)
+    permission_classes = (IsAuthenticated,)
+    pagination_class = CreatedAtCursorPagination
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):
+            return Pedido.objects.none()
+        return self.request.user.pedidos.select_related('pagamento')
@@ -0,0 +1,128 @@
+import pickle
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from user.cache import LRUCache
+from user.models import TokenAcesso
+
+_tokens_locais = LRUCache(max_size=settings.TOKEN_CACHE_MAX_SIZE, timeout=settings.TOKEN_CACHE_LOCAL_TIMEOUT)
+
+
+def chave_token(key):
+    return f'auth:token:{key}'
+
+
+def invalidar_token(key):
+    chave = chave_token(key)
+    _tokens_locais.delete(chave)
+    cache.delete(chave)
+
+
+def invalidar_tokens_usuario(usuario_id):
+    for key in TokenAcesso.objects.filter(usuario_id=usuario_id).values_list('key', flat=True):
+        invalidar_token(key)
+
+
+def emitir_token(usuario):
+    # Cada login gera um token novo; os mais antigos além do limite por usuário são descartados
+    token = TokenAcesso.objects.create(usuario=usuario)
+    antigos = list(
+        TokenAcesso.objects.filter(usuario=usuario)
+        .order_by('-emitido_em')
+        .values_list('key', flat=True)[settings.TOKEN_MAX_POR_USUARIO:]
+    )
+    if antigos:
+        TokenAcesso.objects.filter(key__in=antigos).delete()
+    return token
+
+
+def _guardar(chave, token):
+    dados = pickle.dumps(token)
+    cache.set(chave, dados, timeout=settings.TOKEN_CACHE_TIMEOUT)
+    _tokens_locais.set(chave, dados)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    # Evita o SELECT token + usuário em toda requisição: primeiro o LRU do
+    # processo, depois o cache compartilhado e só então o banco. O token é
+    # guardado serializado para cada requisição receber sua própria instância
+    # do usuário.
+    model = TokenAcesso
+
+    def _buscar(self, key):
+        try:
+            return self.get_model().objects.select_related('usuario').get(key=key)
+        except self.get_model().DoesNotExist:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+    def _ler_cache(self, chave):
+        dados = _tokens_locais.get(chave)
+        if dados is None:
+            dados = cache.get(chave)
+            if dados is not None:
+                _tokens_locais.set(chave, dados)
+        return dados
+
+    def authenticate_credentials(self, key):
+        chave = chave_token(key)
+        dados = self._ler_cache(chave)
+        if dados is None:
+            token = self._buscar(key)
+            _guardar(chave, token)
+        else:
+            token = pickle.loads(dados)
+
+        agora = timezone.now()
+        if token.expira_em < agora:
+            # A cópia em cache pode estar atrasada em relação ao banco
+            token = self._buscar(key)
+            if token.expira_em < agora:
+                token.delete()
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            _guardar(chave, token)
+
+        if not token.usuario.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+
+        # Renovação deslizante com escrita agrupada: o último uso só é gravado depois de
+        # TOKEN_RENOVACAO_INTERVALO, e o UPDATE condicional evita que vários processos gravem juntos
+        renovar_antes_de = agora - timedelta(seconds=settings.TOKEN_RENOVACAO_INTERVALO)
+        if token.ultimo_uso < renovar_antes_de:
+            TokenAcesso.objects.filter(key=key, ultimo_uso__lt=renovar_antes_de).update(ultimo_uso=agora)
+            token.ultimo_uso = agora
+            _guardar(chave, token)
+
+        return (token.usuario, token)
+
+    async def aauthenticate_credentials(self, key):
+        # Caminho comum (token em cache, válido e renovado há pouco) só lê o cache, numa thread
+        # própria; os demais casos precisam do banco e passam pela versão síncrona
+        dados = await sync_to_async(self._ler_cache, thread_sensitive=False)(chave_token(key))
+        if dados is not None:
+            token = pickle.loads(dados)
+            agora = timezone.now()
+            renovar_antes_de = agora - timedelta(seconds=settings.TOKEN_RENOVACAO_INTERVALO)
+            if token.expira_em >= agora and token.ultimo_uso >= renovar_antes_de:
+                if not token.usuario.is_active:
+                    raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+                return (token.usuario, token)
+        return await sync_to_async(self.authenticate_credentials)(key)
+
+
+async def autenticar_async(request):
+    # Equivalente à autenticação do DRF para as views assíncronas (user.apis.async_views)
+    partes = request.headers.get('Authorization', '').split()
+    if len(partes) != 2 or partes[0].lower() != 'token':
+        return None
+    try:
+        usuario, _token = await CachedTokenAuthentication().aauthenticate_credentials(partes[1])
+    except exceptions.AuthenticationFailed:
+        return None
+    return usuario
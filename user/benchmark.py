@@ -0,0 +1,42 @@
+import statistics
+import time
+
+
+def percentil(valores, p):
+    valores = sorted(valores)
+    return valores[min(len(valores) - 1, int(len(valores) * p))]
+
+
+def medir(funcao, repeticoes, aquecimento=0):
+    for _ in range(aquecimento):
+        funcao()
+
+    latencias = []
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        inicio_chamada = time.perf_counter()
+        funcao()
+        latencias.append((time.perf_counter() - inicio_chamada) * 1000)
+    return resumir(latencias, time.perf_counter() - inicio)
+
+
+def resumir(latencias, duracao):
+    return {
+        'n': len(latencias),
+        'ops_s': round(len(latencias) / duracao, 1),
+        'p50_ms': round(statistics.median(latencias), 3),
+        'p99_ms': round(percentil(latencias, 0.99), 3),
+    }
+
+
+def comparar(atual, anterior, tolerancia):
+    # Devolve os cenários cujo p50 piorou mais que a tolerância (em %) em relação à execução anterior
+    regressoes = {}
+    for nome, resultado in atual.items():
+        if nome not in anterior:
+            continue
+        antes, depois = anterior[nome]['p50_ms'], resultado['p50_ms']
+        variacao = (depois - antes) / antes * 100 if antes else 0
+        if variacao > tolerancia:
+            regressoes[nome] = round(variacao, 1)
+    return regressoes
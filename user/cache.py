@@ -0,0 +1,50 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.db import transaction
+
+
+class LRUCache:
+    """Cache em memória do processo, limitado a ``max_size`` entradas e, opcionalmente, com expiração."""
+
+    def __init__(self, max_size=10000, timeout=None):
+        self.max_size = max_size
+        self.timeout = timeout
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, chave):
+        with self._lock:
+            item = self._dados.get(chave)
+            if item is None:
+                return None
+            expira_em, valor = item
+            if expira_em is not None and expira_em < time.monotonic():
+                del self._dados[chave]
+                return None
+            self._dados.move_to_end(chave)
+            return valor
+
+    def set(self, chave, valor):
+        expira_em = time.monotonic() + self.timeout if self.timeout is not None else None
+        with self._lock:
+            self._dados[chave] = (expira_em, valor)
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.max_size:
+                self._dados.popitem(last=False)
+
+    def delete(self, chave):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def clear(self):
+        with self._lock:
+            self._dados.clear()
+
+
+def invalidar_com_commit(invalidar, *args):
+    # Invalida agora e de novo depois do commit: entre a escrita e o commit outra requisição ainda lê
+    # o valor antigo do banco e pode guardá-lo de volta no cache
+    invalidar(*args)
+    transaction.on_commit(lambda: invalidar(*args))
@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches, deploy=True)
+def verificar_cache_compartilhado(app_configs, **kwargs):
+    # Tokens, limites de login e os caches de CPF e pagamento dependem de um cache visto por todos os workers
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend.endswith(('LocMemCache', 'DummyCache')):
+        return [Warning(
+            "O cache padrão é local de cada processo.",
+            hint="Defina CACHE_URL (Redis) quando houver mais de um worker: sem ele, tokens revogados e "
+                 "limites de tentativas de login não são compartilhados entre os processos.",
+            id='user.W001',
+        )]
+    return []
+
+
+@register(deploy=True)
+def verificar_chave_snapshot(app_configs, **kwargs):
+    chave = settings.SNAPSHOT_SIGNING_KEY
+    if not chave or chave == settings.SECRET_KEY:
+        return [Warning(
+            "SNAPSHOT_SIGNING_KEY não definida ou igual ao SECRET_KEY.",
+            hint="Os leitores da portaria recebem essa chave: use uma exclusiva para eles. Sem ela os "
+                 "endpoints de snapshot falham.",
+            id='user.W002',
+        )]
+    return []
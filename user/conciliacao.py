@@ -0,0 +1,99 @@
+import csv
+import json
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from user.exportar import FORMATO_JSONL
+from user.models import Pedido, PedidoStatus, LancamentoPix
+
+
+def ler_extrato(arquivo, formato):
+    # Cada lançamento tem os campos do PIX recebido na API do BACEN: txid, valor e horario
+    if formato == FORMATO_JSONL:
+        for linha in arquivo:
+            if linha.strip():
+                yield json.loads(linha)
+    else:
+        yield from csv.DictReader(arquivo)
+
+
+def _em_lotes(iteravel, tamanho):
+    iteravel = iter(iteravel)
+    while lote := list(islice(iteravel, tamanho)):
+        yield lote
+
+
+_TXID_MAXIMO = LancamentoPix._meta.get_field('txid').max_length
+_VALOR = LancamentoPix._meta.get_field('valor')
+_VALOR_MAXIMO = Decimal(10) ** (_VALOR.max_digits - _VALOR.decimal_places)
+_CENTAVOS = Decimal(1).scaleb(-_VALOR.decimal_places)
+
+
+def _ler_lancamento(lancamento):
+    # Recusa aqui o que o banco recusaria: no PostgreSQL uma única linha com txid longo demais ou
+    # valor fora do campo derrubaria o bulk_create do lote inteiro
+    txid = str(lancamento.get('txid') or '').strip()
+    if not txid or len(txid) > _TXID_MAXIMO:
+        return None
+    try:
+        valor = Decimal(str(lancamento['valor']))
+    except (KeyError, InvalidOperation):
+        return None
+    if not valor.is_finite() or not 0 < valor < _VALOR_MAXIMO or valor != valor.quantize(_CENTAVOS):
+        return None
+
+    try:
+        horario = parse_datetime(str(lancamento.get('horario') or '')) or timezone.now()
+    except ValueError:
+        return None
+    if timezone.is_naive(horario):
+        horario = timezone.make_aware(horario)
+    return txid, valor, horario
+
+
+def conciliar_lote(lancamentos):
+    resultado = Counter(lidos=len(lancamentos))
+    recebidos = {}
+    for lancamento in lancamentos:
+        lido = _ler_lancamento(lancamento)
+        if lido is None:
+            resultado['invalidos'] += 1
+        elif lido[0] in recebidos:
+            resultado['duplicados'] += 1
+        else:
+            recebidos[lido[0]] = LancamentoPix(txid=lido[0], valor=lido[1], horario=lido[2])
+
+    with transaction.atomic():
+        # Um INSERT para o lote inteiro; txids de extratos já processados são ignorados
+        LancamentoPix.objects.bulk_create(recebidos.values(), ignore_conflicts=True)
+
+        # Dois UPDATEs por lote, casando pedido e lançamento pelo índice único do txid. O status
+        # AGUARDANDO no filtro evita conciliar duas vezes o mesmo pedido
+        lancamento = LancamentoPix.objects.filter(txid=OuterRef('txid'))
+        aguardando = Pedido.objects.filter(txid__in=list(recebidos), status=PedidoStatus.AGUARDANDO)
+        resultado['pagos'] = aguardando.filter(valor=Subquery(lancamento.values('valor'))).update(
+            status=PedidoStatus.PAGO,
+            valor_pago=F('valor'),
+            pago_em=Subquery(lancamento.values('horario')),
+        )
+        # O que sobrou aguardando e tem lançamento foi pago com outro valor
+        resultado['divergentes'] = aguardando.update(
+            status=PedidoStatus.DIVERGENTE,
+            valor_pago=Subquery(lancamento.values('valor')),
+            pago_em=Subquery(lancamento.values('horario')),
+        )
+    resultado['sem_pedido'] = len(recebidos) - resultado['pagos'] - resultado['divergentes']
+    return resultado
+
+
+def conciliar(lancamentos, tamanho_lote=5000):
+    resultado = Counter()
+    for lote in _em_lotes(lancamentos, tamanho_lote):
+        resultado.update(conciliar_lote(lote))
+    return resultado
@@ -0,0 +1,70 @@
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+
+# Guardado no cache para CPFs sem usuário, para que consultas repetidas (robôs testando CPFs)
+# não cheguem ao banco
+_INEXISTENTE = 'inexistente'
+
+
+def normalizar_cpf(valor):
+    # Aceita o CPF com ou sem pontuação; zeros à esquerda se perdem, como no campo inteiro do modelo
+    digitos = re.sub(r'\D', '', str(valor or '')).lstrip('0')
+    if not digitos or len(digitos) > 11:
+        return None
+    return int(digitos)
+
+
+def cpf_valido(cpf):
+    digitos = [int(digito) for digito in f'{cpf:011d}']
+    if len(set(digitos)) == 1:
+        return False
+    for posicao in (9, 10):
+        soma = sum(digito * (posicao + 1 - i) for i, digito in enumerate(digitos[:posicao]))
+        if soma * 10 % 11 % 10 != digitos[posicao]:
+            return False
+    return True
+
+
+def validar_cpf(cpf):
+    # Para CPFs novos ou alterados (cadastro pela API, create_user e admin), não para o campo do
+    # modelo: usuários antigos com CPFs que não passam continuam podendo ser editados
+    cpf = normalizar_cpf(cpf)
+    if cpf is None or not cpf_valido(cpf):
+        raise ValidationError("CPF inválido.", code='invalid_cpf')
+
+
+def completar_cpf(base):
+    # CPF válido a partir dos 9 primeiros dígitos, para dados gerados (testes de carga)
+    digitos = [int(digito) for digito in f'{base:09d}']
+    for posicao in (9, 10):
+        soma = sum(digito * (posicao + 1 - i) for i, digito in enumerate(digitos))
+        digitos.append(soma * 10 % 11 % 10)
+    return int(''.join(map(str, digitos)))
+
+
+def chave_cpf(cpf):
+    return f'cpf:{cpf}'
+
+
+def get_primeiro_acesso(cpf):
+    # is_primeiro_acesso do usuário com esse CPF, ou None se não existe
+    chave = chave_cpf(cpf)
+    primeiro_acesso = cache.get(chave)
+    if primeiro_acesso is None:
+        # user.models importa este módulo: o modelo é obtido só na hora da consulta
+        primeiro_acesso = get_user_model().objects.filter(cpf=cpf).values_list('is_primeiro_acesso', flat=True).first()
+        if primeiro_acesso is None:
+            cache.set(chave, _INEXISTENTE, timeout=settings.CPF_CACHE_NEGATIVO_TIMEOUT)
+            return None
+        cache.set(chave, primeiro_acesso, timeout=settings.CPF_CACHE_TIMEOUT)
+    if primeiro_acesso == _INEXISTENTE:
+        return None
+    return primeiro_acesso
+
+
+def invalidar_cpfs(cpfs):
+    cache.delete_many([chave_cpf(cpf) for cpf in cpfs])
@@ -0,0 +1,87 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from user.models import EmailPendente, EmailStatus
+
+logger = logging.getLogger(__name__)
+
+
+def enfileirar_email(assunto, mensagem, destinatarios, remetente=None):
+    return EmailPendente.objects.create(
+        assunto=assunto,
+        mensagem=mensagem,
+        remetente=remetente or settings.DEFAULT_FROM_EMAIL,
+        destinatarios=list(destinatarios),
+    )
+
+
+def _falhou(email, erro, agora):
+    email.tentativas += 1
+    email.erro = str(erro)
+    if email.tentativas >= settings.EMAIL_MAX_TENTATIVAS:
+        email.status = EmailStatus.FALHOU
+        # Não será mais enviada: a senha temporária que a mensagem pode conter não fica guardada
+        email.mensagem = ''
+    else:
+        # Backoff exponencial: 30s, 1min, 2min, 4min...
+        email.proxima_tentativa = agora + timedelta(seconds=settings.EMAIL_BACKOFF_SEGUNDOS * 2 ** (email.tentativas - 1))
+
+
+def _reservar(lote, agora):
+    # Transação curta: os e-mails são reservados empurrando proxima_tentativa para depois do tempo
+    # máximo do envio do lote, e os locks são soltos antes de falar com o servidor SMTP. Se o worker
+    # morrer no meio, os e-mails voltam para a fila quando a reserva vencer
+    with transaction.atomic():
+        # skip_locked: vários workers podem rodar juntos sem pegar os mesmos e-mails
+        emails = list(
+            EmailPendente.objects.select_for_update(skip_locked=True)
+            .filter(status=EmailStatus.PENDENTE, proxima_tentativa__lte=agora)
+            .order_by('proxima_tentativa')[:lote]
+        )
+        if emails:
+            reservado_ate = agora + timedelta(seconds=settings.EMAIL_TIMEOUT * (len(emails) + 1))
+            EmailPendente.objects.filter(pk__in=[email.pk for email in emails]) \
+                .update(proxima_tentativa=reservado_ate)
+    return emails
+
+
+def enviar_emails_pendentes(lote=50):
+    agora = timezone.now()
+    emails = _reservar(lote, agora)
+    if not emails:
+        return 0
+
+    # Uma única conexão SMTP (handshake + TLS) para o lote inteiro
+    conexao = get_connection()
+    try:
+        conexao.open()
+    except Exception as erro:
+        logger.warning("Não foi possível conectar ao servidor de e-mail: %s", erro)
+        for email in emails:
+            _falhou(email, erro, agora)
+    else:
+        with conexao:
+            for email in emails:
+                mensagem = EmailMessage(email.assunto, email.mensagem, email.remetente, email.destinatarios,
+                                        connection=conexao)
+                try:
+                    mensagem.send()
+                except Exception as erro:
+                    logger.warning("Falha ao enviar e-mail %s: %s", email.pk, erro)
+                    _falhou(email, erro, agora)
+                else:
+                    email.status = EmailStatus.ENVIADO
+                    email.enviado_em = timezone.now()
+                    # A mensagem pode conter senha temporária: não fica guardada depois de enviada
+                    email.mensagem = ''
+                    email.erro = ''
+
+    EmailPendente.objects.bulk_update(
+        emails, ['status', 'tentativas', 'proxima_tentativa', 'erro', 'mensagem', 'enviado_em']
+    )
+    return len(emails)
@@ -0,0 +1,96 @@
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from user.models import Lote, Reserva, ReservaStatus, Usuario
+
+
+class LimiteReservasExcedido(Exception):
+    pass
+
+
+def _decrementar(lote_id, quantidade):
+    # UPDATE condicional: uma única instrução, sem SELECT ... FOR UPDATE antes. Compradores
+    # concorrentes nunca levam o disponível abaixo de zero
+    return Lote.objects.filter(pk=lote_id, disponivel__gte=quantidade) \
+        .update(disponivel=F('disponivel') - quantidade) > 0
+
+
+def _devolver(lote_id, quantidade):
+    Lote.objects.filter(pk=lote_id).update(disponivel=F('disponivel') + quantidade)
+
+
+def retirar_do_estoque(lote_id, quantidade):
+    # Deve ser a última escrita da transação da compra: no PostgreSQL o lock da linha do lote
+    # (a linha mais disputada na abertura das vendas) fica preso só até o commit logo em seguida
+    if _decrementar(lote_id, quantidade):
+        return True
+    # Esgotado: antes de recusar, devolve ao estoque as reservas vencidas deste lote
+    if liberar_reservas_expiradas(lote_id=lote_id):
+        return _decrementar(lote_id, quantidade)
+    return False
+
+
+def criar_reserva(lote_id, usuario, quantidade):
+    # Retorna None se o lote não tem a quantidade; LimiteReservasExcedido se, com esta, o usuário
+    # passaria a segurar mais que RESERVA_MAXIMO_POR_USUARIO ingressos em reservas ativas
+    with transaction.atomic():
+        agora = timezone.now()
+        reserva = Reserva.objects.create(
+            lote_id=lote_id,
+            usuario=usuario,
+            quantidade=quantidade,
+            expira_em=agora + timedelta(seconds=settings.RESERVA_VALIDADE),
+        )
+        # A reserva é inserida antes da soma e as reservas do mesmo usuário esperam o lock da linha
+        # dele: duas reservas concorrentes não passam juntas pelo limite
+        list(Usuario.objects.select_for_update().filter(pk=usuario.pk).values_list('pk'))
+        reservado = Reserva.objects.filter(usuario=usuario, status=ReservaStatus.ATIVA, expira_em__gt=agora) \
+            .aggregate(total=Sum('quantidade'))['total']
+        if reservado > settings.RESERVA_MAXIMO_POR_USUARIO:
+            raise LimiteReservasExcedido()
+        if not retirar_do_estoque(lote_id, quantidade):
+            transaction.set_rollback(True)
+            return None
+    return reserva
+
+
+def confirmar_reserva(reserva_id, usuario, quantidade):
+    # Marca a reserva como confirmada (uma única vez) e devolve ao estoque o que não foi comprado.
+    # Retorna o lote da reserva, ou None se ela não existe, venceu ou é menor que a compra
+    ativa = Reserva.objects.filter(pk=reserva_id, usuario=usuario, status=ReservaStatus.ATIVA,
+                                   expira_em__gt=timezone.now())
+    reserva = ativa.filter(quantidade__gte=quantidade).values_list('lote_id', 'quantidade').first()
+    if reserva is None:
+        return None
+    lote_id, reservado = reserva
+
+    if not ativa.update(status=ReservaStatus.CONFIRMADA):
+        return None
+    if reservado > quantidade:
+        _devolver(lote_id, reservado - quantidade)
+    return lote_id
+
+
+def liberar_reservas_expiradas(lote_id=None, limite=1000):
+    # Expira as reservas vencidas e devolve as quantidades com um UPDATE por lote de ingressos
+    with transaction.atomic():
+        reservas = Reserva.objects.select_for_update(skip_locked=True) \
+            .filter(status=ReservaStatus.ATIVA, expira_em__lte=timezone.now())
+        if lote_id is not None:
+            reservas = reservas.filter(lote_id=lote_id)
+        reservas = list(reservas.values_list('pk', 'lote_id', 'quantidade')[:limite])
+        if not reservas:
+            return 0
+
+        Reserva.objects.filter(pk__in=[pk for pk, _, _ in reservas]).update(status=ReservaStatus.EXPIRADA)
+        devolucoes = Counter()
+        for _, reserva_lote_id, quantidade in reservas:
+            devolucoes[reserva_lote_id] += quantidade
+        for reserva_lote_id, quantidade in devolucoes.items():
+            _devolver(reserva_lote_id, quantidade)
+    return len(reservas)
@@ -0,0 +1,73 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from user.models import Ingresso
+
+FORMATO_CSV = 'csv'
+FORMATO_JSONL = 'jsonl'
+
+FORMATOS = (
+    (FORMATO_CSV, "CSV"),
+    (FORMATO_JSONL, "JSON Lines"),
+)
+
+CONTENT_TYPES = {
+    FORMATO_CSV: 'text/csv; charset=utf-8',
+    FORMATO_JSONL: 'application/x-ndjson; charset=utf-8',
+}
+
+CAMPOS = (
+    'id',
+    'nome',
+    'data_nascimento',
+    'situacao',
+    'created_at',
+    'utilizado_em',
+    'usuario__cpf',
+    'usuario__first_name',
+    'usuario__last_name',
+    'usuario__email',
+)
+
+
+def filtrar_ingressos(utilizado_de=None, utilizado_ate=None, utilizados=None):
+    queryset = Ingresso.objects.all()
+    if utilizado_de is not None:
+        queryset = queryset.filter(utilizado_em__gte=utilizado_de)
+    if utilizado_ate is not None:
+        queryset = queryset.filter(utilizado_em__lte=utilizado_ate)
+    if utilizados is not None:
+        queryset = queryset.filter(utilizado_em__isnull=not utilizados)
+    return queryset.order_by('created_at', 'id')
+
+
+class _Eco:
+    # csv.writer escreve em um "arquivo" que só devolve a linha formatada
+    def write(self, valor):
+        return valor
+
+
+def _linhas(queryset, chunk_size):
+    # values() + iterator(): sem instanciar modelos e, no PostgreSQL, com cursor
+    # no servidor, então a memória não cresce com o número de ingressos
+    return queryset.values_list(*CAMPOS).iterator(chunk_size=chunk_size)
+
+
+def exportar_csv(queryset, chunk_size=2000):
+    escritor = csv.writer(_Eco())
+    yield escritor.writerow(CAMPOS)
+    for linha in _linhas(queryset, chunk_size):
+        yield escritor.writerow(linha)
+
+
+def exportar_jsonl(queryset, chunk_size=2000):
+    for linha in _linhas(queryset, chunk_size):
+        yield json.dumps(dict(zip(CAMPOS, linha)), cls=DjangoJSONEncoder) + '\n'
+
+
+def exportar_ingressos(queryset, formato=FORMATO_CSV, chunk_size=2000):
+    if formato == FORMATO_JSONL:
+        return exportar_jsonl(queryset, chunk_size=chunk_size)
+    return exportar_csv(queryset, chunk_size=chunk_size)
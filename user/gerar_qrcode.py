@@ -1,31 +1,296 @@
+import hashlib
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
 import qrcode
 import base64
 from io import BytesIO
+from PIL import Image
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.module_loading import import_string
+
+from user.cache import LRUCache
+from user.metricas import instrumentar
+
+
+FORMATO_PNG = 'png'
+FORMATO_SVG = 'svg'
+FORMATO_BITS = 'bits'
 
+FORMATOS = (
+    (FORMATO_PNG, "PNG em base64"),
+    (FORMATO_SVG, "SVG"),
+    (FORMATO_BITS, "Matriz de bits compactada"),
+)
 
-def gerar_qr_code_base64(texto):
-    # Cria um objeto QRCode
+
+def gerar_qr_code_matriz(texto, border=4):
     qr = qrcode.QRCode(
         version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        border=border,
     )
-
     qr.add_data(texto)
     qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def gerar_qr_code_png(texto, box_size=10, border=4):
+    matriz = gerar_qr_code_matriz(texto, border=border)
+    tamanho = len(matriz)
 
-    # Cria uma imagem PIL do QR Code
-    img = qr.make_image(fill_color="black", back_color="white")
+    # Imagem de 1 bit por módulo, ampliada sem interpolação: o PNG final
+    # também fica em 1 bit por pixel
+    img = Image.new("1", (tamanho, tamanho), 1)
+    img.putdata([0 if modulo else 1 for linha in matriz for modulo in linha])
+    if box_size > 1:
+        img = img.resize((tamanho * box_size, tamanho * box_size), Image.NEAREST)
 
-    # Salva a imagem em bytes
     buffered = BytesIO()
-    img.save(buffered, format="PNG")
+    img.save(buffered, format="PNG", optimize=True)
+    return buffered.getvalue()
+
+
+@instrumentar('qrcode_png')
+def gerar_qr_code_base64(texto, box_size=10, border=4):
+    img = gerar_qr_code_png(texto, box_size=box_size, border=border)
+    return base64.b64encode(img).decode('utf-8')
+
+
+@instrumentar('qrcode_svg')
+def gerar_qr_code_svg(texto, border=4):
+    matriz = gerar_qr_code_matriz(texto, border=border)
+    tamanho = len(matriz)
+
+    # Um único path com um retângulo por sequência horizontal de módulos escuros
+    caminho = []
+    for y, linha in enumerate(matriz):
+        x = 0
+        while x < tamanho:
+            if linha[x]:
+                inicio = x
+                while x < tamanho and linha[x]:
+                    x += 1
+                caminho.append(f'M{inicio} {y}h{x - inicio}v1h-{x - inicio}z')
+            else:
+                x += 1
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {tamanho} {tamanho}" shape-rendering="crispEdges">'
+        f'<path fill="#fff" d="M0 0h{tamanho}v{tamanho}H0z"/>'
+        f'<path d="{"".join(caminho)}"/></svg>'
+    )
+
+
+@instrumentar('qrcode_bits')
+def gerar_qr_code_bits(texto, border=4):
+    matriz = gerar_qr_code_matriz(texto, border=border)
+    tamanho = len(matriz)
+
+    # Módulos em ordem de linha, 8 por byte, bit mais significativo primeiro
+    bits = bytearray((tamanho * tamanho + 7) // 8)
+    for i, modulo in enumerate(modulo for linha in matriz for modulo in linha):
+        if modulo:
+            bits[i >> 3] |= 0x80 >> (i & 7)
+
+    return {
+        "size": tamanho,
+        "bits": base64.b64encode(bytes(bits)).decode('utf-8'),
+    }
+
+
+BOX_SIZE_PADRAO = 10
+BORDER_PADRAO = 4
+
+
+def gerar_qr_code(texto, formato=FORMATO_PNG, box_size=10, border=4):
+    if formato == FORMATO_SVG:
+        return gerar_qr_code_svg(texto, border=border)
+    if formato == FORMATO_BITS:
+        return gerar_qr_code_bits(texto, border=border)
+    return gerar_qr_code_base64(texto, box_size=box_size, border=border)
+
+
+class LRUQrCodeCache(LRUCache):
+    """Cache em memória do processo, limitado a ``max_size`` entradas."""
+
+    somente_padrao = False
+
+    def __init__(self, max_size=10000):
+        super().__init__(max_size=max_size)
+
+
+class DjangoQrCodeCache:
+    """Cache compartilhado entre processos usando o framework de cache do Django.
+
+    O backend não tem limite de tamanho, então as entradas expiram após ``timeout`` segundos e,
+    com ``somente_padrao``, só a renderização padrão (box_size=10, border=4) é guardada: os outros
+    tamanhos pedidos pelos clientes são gerados na hora."""
+
+    def __init__(self, alias='default', timeout=86400, somente_padrao=True):
+        self.alias = alias
+        self.timeout = timeout
+        self.somente_padrao = somente_padrao
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def get(self, chave):
+        return self.cache.get(chave)
+
+    def set(self, chave, valor):
+        self.cache.set(chave, valor, timeout=self.timeout)
+
+    def clear(self):
+        self.cache.clear()
+
+
+_qr_code_cache = None
+_qr_code_cache_lock = threading.Lock()
+
+
+def get_qr_code_cache():
+    global _qr_code_cache
+    if _qr_code_cache is None:
+        with _qr_code_cache_lock:
+            if _qr_code_cache is None:
+                config = getattr(settings, 'QRCODE_CACHE', {})
+                backend = import_string(config.get('BACKEND', 'user.gerar_qrcode.LRUQrCodeCache'))
+                _qr_code_cache = backend(**config.get('OPTIONS', {}))
+    return _qr_code_cache
+
+
+def reset_qr_code_cache():
+    global _qr_code_cache
+    with _qr_code_cache_lock:
+        _qr_code_cache = None
+
+
+def chave_qr_code(texto, **parametros):
+    # O conteúdo do QR Code nunca muda para o mesmo ingresso, então a chave
+    # é o hash do texto junto com os parâmetros de renderização.
+    conteudo = '|'.join([str(texto)] + [f'{k}={parametros[k]}' for k in sorted(parametros)])
+    return 'qrcode:' + hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def chave_qr_code_formato(texto, formato=FORMATO_PNG, box_size=10, border=4):
+    # box_size só influencia o PNG
+    if formato == FORMATO_PNG:
+        return chave_qr_code(texto, formato=formato, box_size=box_size, border=border)
+    return chave_qr_code(texto, formato=formato, border=border)
+
+
+def _usa_cache(cache, formato, box_size, border):
+    if not cache.somente_padrao:
+        return True
+    return border == BORDER_PADRAO and (formato != FORMATO_PNG or box_size == BOX_SIZE_PADRAO)
+
+
+def obter_qr_code(texto, formato=FORMATO_PNG, box_size=10, border=4):
+    cache = get_qr_code_cache()
+    if not _usa_cache(cache, formato, box_size, border):
+        return gerar_qr_code(texto, formato=formato, box_size=box_size, border=border)
+    chave = chave_qr_code_formato(texto, formato=formato, box_size=box_size, border=border)
+    qr_code = cache.get(chave)
+    if qr_code is None:
+        qr_code = gerar_qr_code(texto, formato=formato, box_size=box_size, border=border)
+        cache.set(chave, qr_code)
+    return qr_code
+
+
+def obter_qr_code_base64(texto, box_size=10, border=4):
+    return obter_qr_code(texto, formato=FORMATO_PNG, box_size=box_size, border=border)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_qr_code_workers():
+    workers = getattr(settings, 'QRCODE_WORKERS', None)
+    if workers is None:
+        workers = min(4, os.cpu_count() or 1)
+    return workers
+
+
+def get_qr_code_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ProcessPoolExecutor(max_workers=get_qr_code_workers())
+    return _executor
+
+
+def encerrar_qr_code_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True, cancel_futures=True)
+            _executor = None
+
+
+def _gerar_qr_code_worker(parametros):
+    # Também roda nos processos do pool, onde as métricas registradas nunca chegariam ao /metrics:
+    # chama as funções sem a instrumentação, e o lote inteiro é medido em qrcode_lote
+    texto, formato, box_size, border = parametros
+    if formato == FORMATO_SVG:
+        return gerar_qr_code_svg.__wrapped__(texto, border=border)
+    if formato == FORMATO_BITS:
+        return gerar_qr_code_bits.__wrapped__(texto, border=border)
+    return gerar_qr_code_base64.__wrapped__(texto, box_size=box_size, border=border)
+
+
+@instrumentar('qrcode_lote')
+def gerar_qr_codes_em_lote(textos, formato=FORMATO_PNG, box_size=10, border=4, executor=None):
+    # Renderiza vários QR Codes sem passar pelo cache. Acima de um lote mínimo,
+    # os textos são distribuídos entre processos; o encoder do qrcode é Python
+    # puro e não se beneficia de threads por causa do GIL.
+    parametros = [(str(texto), formato, box_size, border) for texto in textos]
+    workers = get_qr_code_workers()
+
+    if executor is None and workers > 1 and len(parametros) >= getattr(settings, 'QRCODE_LOTE_MINIMO', 8):
+        executor = get_qr_code_executor()
+
+    if executor is not None:
+        chunksize = max(1, len(parametros) // (workers * 4))
+        try:
+            return list(executor.map(_gerar_qr_code_worker, parametros, chunksize=chunksize))
+        except (BrokenProcessPool, OSError, NotImplementedError):
+            # Sem suporte a processos (ou pool quebrado): segue sequencial
+            encerrar_qr_code_executor()
+
+    return [_gerar_qr_code_worker(p) for p in parametros]
+
+
+def obter_qr_codes(textos, formato=FORMATO_PNG, box_size=10, border=4):
+    cache = get_qr_code_cache()
+    textos = list(textos)
+    if not _usa_cache(cache, formato, box_size, border):
+        return gerar_qr_codes_em_lote(textos, formato=formato, box_size=box_size, border=border)
+    chaves = [chave_qr_code_formato(texto, formato=formato, box_size=box_size, border=border) for texto in textos]
+
+    qr_codes = [cache.get(chave) for chave in chaves]
+    faltando = [i for i, qr_code in enumerate(qr_codes) if qr_code is None]
+    if faltando:
+        gerados = gerar_qr_codes_em_lote(
+            [textos[i] for i in faltando], formato=formato, box_size=box_size, border=border
+        )
+        for i, qr_code in zip(faltando, gerados):
+            qr_codes[i] = qr_code
+            cache.set(chaves[i], qr_code)
+    return qr_codes
 
-    # Converte os bytes da imagem para base64
-    img_str = base64.b64encode(buffered.getvalue()).decode('utf-8')
 
-    return img_str
+def precalcular_qr_codes(textos, formatos=(FORMATO_PNG,)):
+    # Usado fora das requisições (manage.py precalcular_qrcodes) para aquecer o cache antes do evento
+    for formato in formatos:
+        obter_qr_codes(textos, formato=formato)
 
 
 # if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from user.models import ChaveIdempotencia, IdempotenciaStatus
+
+CABECALHO = 'Idempotency-Key'
+
+
+def hash_requisicao(dados):
+    conteudo = json.dumps(dados, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+
+def _tomar_chave(usuario, chave, rota, hash_dados):
+    # Registra a chave ou trava a linha já existente, dentro da transação da requisição. Retorna
+    # (registro, criado); o INSERT vem primeiro porque a primeira tentativa é o caso comum. Uma
+    # repetição concorrente espera no INSERT (PostgreSQL: restrição única; SQLite: lock de escrita)
+    # até a primeira terminar, e então encontra a resposta gravada ou, se ela falhou, a chave livre
+    try:
+        with transaction.atomic():
+            return ChaveIdempotencia.objects.create(usuario=usuario, chave=chave, rota=rota,
+                                                    hash_requisicao=hash_dados), True
+    except IntegrityError:
+        pass
+
+    registro = ChaveIdempotencia.objects.select_for_update().get(usuario=usuario, chave=chave)
+    # Só uma resposta gravada há mais de IDEMPOTENCIA_VALIDADE é descartada; a chave volta a valer
+    # para uma requisição nova
+    agora = timezone.now()
+    if registro.status == IdempotenciaStatus.CONCLUIDA and \
+            agora - registro.created_at > timedelta(seconds=settings.IDEMPOTENCIA_VALIDADE):
+        registro.rota, registro.hash_requisicao, registro.created_at = rota, hash_dados, agora
+        registro.status, registro.status_code, registro.resposta = IdempotenciaStatus.PROCESSANDO, None, None
+        registro.save()
+        return registro, True
+    return registro, False
+
+
+def idempotente(view):
+    # Para ações POST: com o cabeçalho Idempotency-Key, uma repetição da mesma requisição devolve a
+    # resposta gravada sem executar a ação de novo. A chave, a ação e a resposta gravada estão na
+    # mesma transação: se o processo morre ou a ação falha, nada fica gravado, nem a chave
+    @functools.wraps(view)
+    def wrapper(self, request, *args, **kwargs):
+        chave = request.headers.get(CABECALHO)
+        if not chave:
+            return view(self, request, *args, **kwargs)
+        if len(chave) > 255:
+            return Response({'error': f'{CABECALHO} deve ter no máximo 255 caracteres.'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        rota = request.resolver_match.view_name
+        hash_dados = hash_requisicao(request.data)
+        with transaction.atomic():
+            registro, criado = _tomar_chave(request.user, chave, rota, hash_dados)
+
+            if not criado:
+                # Só uma chave gravada por uma versão anterior, que a registrava em outra transação
+                if registro.status == IdempotenciaStatus.PROCESSANDO:
+                    return Response({'error': 'Requisição com a mesma chave ainda em processamento.'},
+                                    status=status.HTTP_409_CONFLICT, headers={'Retry-After': '1'})
+                if registro.rota != rota or registro.hash_requisicao != hash_dados:
+                    return Response({'error': f'{CABECALHO} já utilizada com outra requisição.'},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                return Response(registro.resposta, status=registro.status_code,
+                                headers={'Idempotent-Replayed': 'true'})
+
+            response = view(self, request, *args, **kwargs)
+            if response.status_code >= 500:
+                # Desfaz a ação e a chave: a próxima tentativa executa de novo
+                transaction.set_rollback(True)
+            else:
+                ChaveIdempotencia.objects.filter(pk=registro.pk).update(
+                    status=IdempotenciaStatus.CONCLUIDA, status_code=response.status_code, resposta=response.data,
+                )
+        return response
+    return wrapper
@@ -0,0 +1,107 @@
+import csv
+import secrets
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models.functions import Lower
+
+from user.cpf import normalizar_cpf, cpf_valido, invalidar_cpfs
+from user.models import Usuario
+
+CAMPOS = ('cpf', 'first_name', 'last_name', 'email', 'birthday')
+
+
+def ler_csv(arquivo):
+    return csv.DictReader(arquivo)
+
+
+def _ler_data(valor):
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(valor, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(valor)
+
+
+def _ler_usuario(linha):
+    cpf = normalizar_cpf(linha.get('cpf'))
+    if cpf is None or not cpf_valido(cpf):
+        return None
+
+    email = (linha.get('email') or '').strip().lower() or None
+    birthday = (linha.get('birthday') or '').strip() or None
+    try:
+        if email:
+            validate_email(email)
+        if birthday:
+            birthday = _ler_data(birthday)
+    except (ValidationError, ValueError):
+        return None
+
+    return {
+        'cpf': cpf,
+        'first_name': (linha.get('first_name') or '').strip()[:150],
+        'last_name': (linha.get('last_name') or '').strip()[:150],
+        'email': email,
+        'birthday': birthday,
+    }
+
+
+def senha_inutilizavel():
+    # Equivalente ao make_password(None), que sorteia os 40 caracteres um a um e pesa
+    # quando são dezenas de milhares de usuários
+    return UNUSABLE_PASSWORD_PREFIX + secrets.token_hex(20)
+
+
+def importar_usuarios(linhas, tamanho_lote=5000, progresso=None):
+    # Valida e remove duplicados em memória e insere com bulk_create, um lote por vez. As senhas
+    # ficam inutilizáveis (sem calcular hash): o usuário define a sua no primeiro acesso
+    resultado = Counter()
+    cpfs, emails = set(), set()
+    linhas = iter(linhas)
+
+    while lote := list(islice(linhas, tamanho_lote)):
+        resultado['lidos'] += len(lote)
+        novos = []
+        for linha in lote:
+            dados = _ler_usuario(linha)
+            if dados is None:
+                resultado['invalidos'] += 1
+            elif dados['cpf'] in cpfs or dados['email'] in emails:
+                resultado['duplicados'] += 1
+            else:
+                cpfs.add(dados['cpf'])
+                if dados['email']:
+                    emails.add(dados['email'])
+                novos.append(dados)
+
+        with transaction.atomic():
+            # Duas consultas por lote para descartar quem já está cadastrado. Os e-mails do arquivo já
+            # estão em minúsculas; os do banco podem ter sido cadastrados com maiúsculas
+            cpfs_existentes = set(Usuario.objects.filter(cpf__in=[dados['cpf'] for dados in novos])
+                                  .values_list('cpf', flat=True))
+            emails_existentes = set(Usuario.objects.annotate(email_minusculo=Lower('email'))
+                                    .filter(email_minusculo__in=[dados['email'] for dados in novos if dados['email']])
+                                    .values_list('email_minusculo', flat=True))
+            usuarios = [
+                Usuario(password=senha_inutilizavel(), **dados) for dados in novos
+                if dados['cpf'] not in cpfs_existentes and dados['email'] not in emails_existentes
+            ]
+            # Quem se cadastrou entre a consulta e o INSERT é ignorado em vez de derrubar a importação;
+            # os ids são gerados aqui, então dá para contar o que de fato entrou
+            Usuario.objects.bulk_create(usuarios, ignore_conflicts=True)
+            importados = Usuario.objects.filter(pk__in=[usuario.pk for usuario in usuarios]).count()
+        # bulk_create não dispara sinais: remove as entradas negativas do cache de CPF
+        invalidar_cpfs([usuario.cpf for usuario in usuarios])
+
+        resultado['existentes'] += len(novos) - importados
+        resultado['importados'] += importados
+        if progresso is not None:
+            progresso(resultado)
+    return resultado
@@ -0,0 +1,72 @@
+from asgiref.sync import sync_to_async
+from django.contrib.auth import authenticate, aauthenticate
+from rest_framework import serializers, status
+
+from user.authentication import emitir_token
+from user.cpf import normalizar_cpf
+from user.ratelimit import limite_login_cpf, limite_login_ip, obter_ip
+
+
+class TentativaLogin:
+    """Regras do login por CPF e senha, usadas pela view do DRF (UserViewSet.login) e pela
+    assíncrona (user.apis.async_views.login). ``executar``/``aexecutar`` devolvem
+    ``(dados, status, headers)`` para cada view montar a sua resposta."""
+
+    def __init__(self, request, dados):
+        self.request = request
+        # "012345678909", " 12345678909" e "123.456.789-09" são o mesmo usuário e o mesmo limite
+        self.cpf = normalizar_cpf(dados['cpf'])
+        self.password = dados['password']
+        self.ip = obter_ip(request)
+        self.limite_cpf = limite_login_cpf()
+        self.limite_ip = limite_login_ip()
+
+    def _bloqueado(self):
+        return ({'error': 'Muitas tentativas. Tente novamente mais tarde.'}, status.HTTP_429_TOO_MANY_REQUESTS,
+                {'Retry-After': str(self.limite_cpf.janela)})
+
+    def _invalido(self):
+        return {'error': 'Invalid credentials.'}, status.HTTP_401_UNAUTHORIZED, {}
+
+    def _inativo(self):
+        return {'error': 'User is inactive.'}, status.HTTP_400_BAD_REQUEST, {}
+
+    def _sucesso(self, user, token):
+        # Mesmo formato (DATETIME_FORMAT) das outras datas da API nas duas views
+        expira_em = serializers.DateTimeField().to_representation(token.expira_em)
+        return {'token': token.key, 'tipo': user.tipo, 'expira_em': expira_em}, status.HTTP_200_OK, {}
+
+    def executar(self):
+        # Rejeita antes de calcular qualquer hash de senha
+        if self.limite_cpf.excedido(self.cpf) or self.limite_ip.excedido(self.ip):
+            return self._bloqueado()
+
+        user = None
+        if self.cpf is not None:
+            user = authenticate(self.request, username=self.cpf, password=self.password)
+        if user is None:
+            self.limite_cpf.registrar(self.cpf)
+            self.limite_ip.registrar(self.ip)
+            return self._invalido()
+        if not user.is_active:
+            return self._inativo()
+
+        self.limite_cpf.limpar(self.cpf)
+        return self._sucesso(user, emitir_token(user))
+
+    async def aexecutar(self):
+        if await self.limite_cpf.aexcedido(self.cpf) or await self.limite_ip.aexcedido(self.ip):
+            return self._bloqueado()
+
+        user = None
+        if self.cpf is not None:
+            user = await aauthenticate(self.request, username=self.cpf, password=self.password)
+        if user is None:
+            await self.limite_cpf.aregistrar(self.cpf)
+            await self.limite_ip.aregistrar(self.ip)
+            return self._invalido()
+        if not user.is_active:
+            return self._inativo()
+
+        await self.limite_cpf.alimpar(self.cpf)
+        return self._sucesso(user, await sync_to_async(emitir_token)(user))
@@ -0,0 +1,150 @@
+import itertools
+import json
+import logging
+import platform
+import random
+import uuid
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.utils import timezone
+
+from user.benchmark import medir, comparar
+from user.cpf import completar_cpf
+from user.gerar_qrcode import gerar_qr_code_base64, obter_qr_code_base64, obter_qr_code, FORMATO_SVG, FORMATO_BITS
+from user.models import Usuario, Ingresso, TokenAcesso, UserType, Pagamento, Evento, Lote
+
+
+class Command(BaseCommand):
+    help = (
+        "Popula usuários e ingressos dentro de uma transação (desfeita ao final) e mede p50/p99 e vazão "
+        "dos endpoints principais pelo cliente de teste do Django, além da geração de QR Codes. "
+        "Use --saida para gravar o resultado em JSON e --comparar para apontar regressões em relação "
+        "a uma execução anterior."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=1000)
+        parser.add_argument('--ingressos-por-usuario', type=int, default=5)
+        parser.add_argument('--requisicoes', type=int, default=200)
+        parser.add_argument('--login', type=int, default=20,
+                            help="Requisições de login, bem mais caras por causa do hash da senha")
+        parser.add_argument('--saida', help="Arquivo JSON onde o resultado é gravado")
+        parser.add_argument('--comparar', help="Arquivo JSON de uma execução anterior")
+        parser.add_argument('--tolerancia', type=float, default=20,
+                            help="Piora máxima do p50, em %%, antes de acusar regressão")
+        parser.add_argument('--json', action='store_true', help="Imprime o resultado em JSON")
+
+    def handle(self, *args, **options):
+        # Respostas 4xx esperadas não devem poluir a saída
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        random.seed(0)
+        requisicoes = options['requisicoes']
+
+        with transaction.atomic():
+            usuarios, tokens, admin = self.popular(options['usuarios'], options['ingressos_por_usuario'])
+            para_validar = iter(Ingresso.objects.bulk_create([
+                Ingresso(usuario_id=usuarios[0], nome='Validação', data_nascimento='2000-01-01')
+                for _ in range(requisicoes + 5)
+            ]))
+            cliente = Client()
+            cpfs = itertools.cycle(Usuario.objects.filter(pk__in=usuarios).values_list('cpf', flat=True))
+            tokens_ciclo = itertools.cycle(tokens)
+            compra = {'ingressos': [{'nome': 'Benchmark', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}]}
+            # A compra precisa de um preço e, se já há lotes cadastrados, de um lote com estoque
+            if not Pagamento.objects.exists():
+                Pagamento.objects.create(chave='benchmark', valor=Decimal('10.00'))
+            if Lote.objects.exists():
+                evento = Evento.objects.create(nome='Benchmark', data=timezone.now())
+                compra['lote'] = str(Lote.objects.create(evento=evento, nome='Benchmark',
+                                                         capacidade=requisicoes + 5).pk)
+
+            cenarios = {
+                'login': (options['login'], lambda: cliente.post(
+                    '/api/user/login/', {'cpf': str(next(cpfs)), 'password': 'senha-benchmark'})),
+                'payment': (requisicoes, lambda: cliente.post(
+                    '/api/ingresso/payment/', compra, content_type='application/json',
+                    HTTP_AUTHORIZATION=f'Token {next(tokens_ciclo)}')),
+                'meus_ingressos': (requisicoes, lambda: cliente.get(
+                    '/api/ingresso/meus_ingressos/', HTTP_AUTHORIZATION=f'Token {next(tokens_ciclo)}')),
+                'validate': (requisicoes, lambda: cliente.post(
+                    '/api/ingresso/validate/', {'ingresso': str(next(para_validar).pk)},
+                    content_type='application/json', HTTP_AUTHORIZATION=f'Token {admin}')),
+                'user_list': (requisicoes, lambda: cliente.get('/api/user/')),
+            }
+            resultados = {
+                nome: medir(requisicao, repeticoes, aquecimento=min(5, repeticoes))
+                for nome, (repeticoes, requisicao) in cenarios.items()
+            }
+
+            transaction.set_rollback(True)
+
+        resultados.update(self.medir_qr_codes(requisicoes))
+        self.relatar(resultados, options)
+
+    def popular(self, quantidade_usuarios, ingressos_por_usuario):
+        # Um único hash reaproveitado: calcular um por usuário dominaria o tempo de preparação
+        senha = make_password('senha-benchmark')
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(cpf=completar_cpf(800000000 + i), password=senha, email=f'benchmark{i}@ingressou.com')
+            for i in range(quantidade_usuarios)
+        ], batch_size=2000)
+        usuarios = [usuario.pk for usuario in usuarios]
+        Ingresso.objects.bulk_create([
+            Ingresso(usuario_id=usuario, nome=f'Ingresso {i}', data_nascimento='2000-01-01')
+            for usuario in usuarios for i in range(ingressos_por_usuario)
+        ], batch_size=5000)
+        tokens = TokenAcesso.objects.bulk_create([TokenAcesso(usuario_id=usuario) for usuario in usuarios])
+
+        admin = Usuario.objects.create(cpf=completar_cpf(799999999), password=senha, tipo=UserType.ADMIN)
+        return usuarios, [token.key for token in tokens], TokenAcesso.objects.create(usuario=admin).key
+
+    def medir_qr_codes(self, repeticoes):
+        textos = itertools.cycle([uuid.uuid4() for _ in range(repeticoes)])
+        em_cache = uuid.uuid4()
+        return {
+            'qrcode_base64': medir(lambda: gerar_qr_code_base64(next(textos)), repeticoes),
+            'qrcode_base64_cache': medir(lambda: obter_qr_code_base64(em_cache), repeticoes * 10, aquecimento=1),
+            'qrcode_svg': medir(lambda: obter_qr_code(uuid.uuid4(), formato=FORMATO_SVG), repeticoes),
+            'qrcode_bits': medir(lambda: obter_qr_code(uuid.uuid4(), formato=FORMATO_BITS), repeticoes),
+        }
+
+    def relatar(self, resultados, options):
+        relatorio = {
+            'data': timezone.now().isoformat(),
+            'ambiente': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'banco': connection.vendor,
+                'hasher': settings.PASSWORD_HASHERS[0],
+            },
+            'parametros': {chave: options[chave] for chave in
+                           ('usuarios', 'ingressos_por_usuario', 'requisicoes', 'login')},
+            'resultados': resultados,
+        }
+        if options['saida']:
+            with open(options['saida'], 'w') as arquivo:
+                json.dump(relatorio, arquivo, indent=2)
+
+        if options['json']:
+            self.stdout.write(json.dumps(relatorio))
+        else:
+            self.stdout.write(f"{'cenário':<22} {'ops/s':>10} {'p50 ms':>10} {'p99 ms':>10}")
+            for nome, resultado in resultados.items():
+                self.stdout.write(
+                    f"{nome:<22} {resultado['ops_s']:>10} {resultado['p50_ms']:>10} {resultado['p99_ms']:>10}"
+                )
+
+        if options['comparar']:
+            with open(options['comparar']) as arquivo:
+                anterior = json.load(arquivo)['resultados']
+            regressoes = comparar(resultados, anterior, options['tolerancia'])
+            if regressoes:
+                raise CommandError("Regressões de p50: " + ", ".join(
+                    f"{nome} +{variacao}%" for nome, variacao in regressoes.items()))
+            self.stdout.write(self.style.SUCCESS("Nenhuma regressão em relação à execução anterior"))
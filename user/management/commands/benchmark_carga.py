@@ -0,0 +1,73 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from user.benchmark import percentil
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera carga HTTP concorrente contra um servidor já rodando e mede vazão e latência. Para comparar "
+        "WSGI e ASGI com a mesma quantidade de workers, suba por exemplo "
+        "'gunicorn -w 4 ingressou_back.wsgi' e 'uvicorn --workers 4 ingressou_back.asgi:application' "
+        "e rode este comando contra /api/ingresso/... e /api/async/ingresso/... respectivamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--metodo', default='GET')
+        parser.add_argument('--corpo', help="Corpo JSON enviado em cada requisição")
+        parser.add_argument('--token', help="Token de acesso (Authorization: Token ...)")
+        parser.add_argument('--requisicoes', type=int, default=500)
+        parser.add_argument('--concorrencia', type=int, nargs='+', default=[1, 10, 50])
+        parser.add_argument('--json', action='store_true', help="Saída em JSON, uma linha por nível")
+
+    def handle(self, *args, **options):
+        headers = {'Content-Type': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f"Token {options['token']}"
+        corpo = options['corpo'].encode('utf-8') if options['corpo'] else None
+
+        def requisicao(_):
+            pedido = urllib.request.Request(options['url'], data=corpo, headers=headers, method=options['metodo'])
+            inicio = time.perf_counter()
+            try:
+                with urllib.request.urlopen(pedido) as resposta:
+                    resposta.read()
+                    codigo = resposta.status
+            except urllib.error.HTTPError as erro:
+                codigo = erro.code
+            except urllib.error.URLError:
+                codigo = 0
+            return codigo, (time.perf_counter() - inicio) * 1000
+
+        if not options['json']:
+            self.stdout.write(f"{'concorrência':>12} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'erros':>7}")
+        for concorrencia in options['concorrencia']:
+            inicio = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+                resultados = list(executor.map(requisicao, range(options['requisicoes'])))
+            duracao = time.perf_counter() - inicio
+
+            latencias = [latencia for _, latencia in resultados]
+            resultado = {
+                'url': options['url'],
+                'concorrencia': concorrencia,
+                'requisicoes': len(resultados),
+                'req_s': round(len(resultados) / duracao, 1),
+                'p50_ms': round(statistics.median(latencias), 2),
+                'p99_ms': round(percentil(latencias, 0.99), 2),
+                'erros': sum(1 for codigo, _ in resultados if codigo == 0 or codigo >= 500),
+            }
+            if options['json']:
+                self.stdout.write(json.dumps(resultado))
+            else:
+                self.stdout.write(
+                    f"{concorrencia:>12} {resultado['req_s']:>10} {resultado['p50_ms']:>10} "
+                    f"{resultado['p99_ms']:>10} {resultado['erros']:>7}"
+                )
@@ -0,0 +1,83 @@
+import random
+import statistics
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from user.cpf import completar_cpf
+from user.models import Usuario, Ingresso, Pagamento
+
+
+class Command(BaseCommand):
+    help = (
+        "Popula uma massa de dados dentro de uma transação (desfeita ao final) e mede o plano e a latência "
+        "das consultas de ingressos e pagamentos. Para comparar antes/depois dos índices, rode com "
+        "'migrate user 0011' e depois com 'migrate user 0012'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuarios', type=int, default=10000)
+        parser.add_argument('--ingressos', type=int, default=100000)
+        parser.add_argument('--repeticoes', type=int, default=200)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            usuarios = self.popular(options['usuarios'], options['ingressos'])
+            agora = timezone.now()
+
+            consultas = {
+                "ingressos do usuário": lambda: Ingresso.objects.filter(
+                    usuario_id=random.choice(usuarios)).order_by('-created_at', '-id')[:50],
+                "não utilizados por data": lambda: Ingresso.objects.filter(
+                    utilizado_em__isnull=True).order_by('created_at')[:50],
+                "check-ins na última hora": lambda: Ingresso.objects.filter(
+                    utilizado_em__gte=agora - timedelta(hours=1)).order_by('utilizado_em')[:50],
+                "pagamento atual": lambda: Pagamento.objects.all().order_by('-created_at')[:1],
+            }
+            for nome, consulta in consultas.items():
+                self.medir(nome, consulta, options['repeticoes'])
+
+            transaction.set_rollback(True)
+
+    def popular(self, quantidade_usuarios, quantidade_ingressos):
+        self.stdout.write(f"Populando {quantidade_usuarios} usuários e {quantidade_ingressos} ingressos...")
+        agora = timezone.now()
+        usuarios = Usuario.objects.bulk_create([
+            Usuario(cpf=completar_cpf(900000000 + i), password='!', email=f'benchmark{i}@ingressou.com')
+            for i in range(quantidade_usuarios)
+        ], batch_size=2000)
+        usuarios = [usuario.pk for usuario in usuarios]
+
+        lote = []
+        for i in range(quantidade_ingressos):
+            # Um em cada três ingressos já foi utilizado em algum momento das últimas 6 horas
+            utilizado_em = agora - timedelta(minutes=random.randint(0, 360)) if i % 3 == 0 else None
+            lote.append(Ingresso(usuario_id=random.choice(usuarios), nome=f'Ingresso {i}',
+                                 data_nascimento='2000-01-01', utilizado_em=utilizado_em))
+            if len(lote) == 5000:
+                Ingresso.objects.bulk_create(lote)
+                lote = []
+        Ingresso.objects.bulk_create(lote)
+
+        Pagamento.objects.bulk_create([
+            Pagamento(chave=f'benchmark-{i}', valor=10) for i in range(100)
+        ])
+        return usuarios
+
+    def medir(self, nome, consulta, repeticoes):
+        duracoes = []
+        for _ in range(repeticoes):
+            inicio = time.perf_counter()
+            list(consulta())
+            duracoes.append((time.perf_counter() - inicio) * 1000)
+        duracoes.sort()
+
+        self.stdout.write(self.style.MIGRATE_HEADING(nome))
+        self.stdout.write(consulta().explain())
+        self.stdout.write(
+            f"p50 {statistics.median(duracoes):.3f} ms  "
+            f"p99 {duracoes[min(len(duracoes) - 1, int(len(duracoes) * 0.99))]:.3f} ms\n"
+        )
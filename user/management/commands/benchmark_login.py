@@ -0,0 +1,58 @@
+import logging
+import time
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from user.cpf import completar_cpf
+from user.models import Usuario
+
+HASHERS = {
+    'pbkdf2': 'user.hashers.TunedPBKDF2PasswordHasher',
+    'scrypt': 'user.hashers.TunedScryptPasswordHasher',
+    'argon2': 'user.hashers.TunedArgon2PasswordHasher',
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Mede logins por segundo em um único processo para cada hasher de senha e o custo de uma "
+        "tentativa rejeitada pelo limite de tentativas. Os dados criados são desfeitos ao final."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requisicoes', type=int, default=20)
+        parser.add_argument('--hashers', nargs='+', choices=list(HASHERS), default=['pbkdf2', 'scrypt'])
+
+    def handle(self, *args, **options):
+        # As respostas 401/429 esperadas gerariam um aviso por requisição
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        cliente = Client()
+        cpf = completar_cpf(900000000)
+
+        self.stdout.write(f"{'cenário':<22} {'req/s':>10} {'ms/req':>10}")
+        with transaction.atomic():
+            for nome in options['hashers']:
+                with override_settings(PASSWORD_HASHERS=[HASHERS[nome]]):
+                    Usuario.objects.filter(cpf=cpf).delete()
+                    Usuario.objects.create_user(password='senha-benchmark', cpf=cpf)
+                    self.medir(f'login {nome}', options['requisicoes'], lambda: cliente.post(
+                        '/api/user/login/', {'cpf': str(cpf), 'password': 'senha-benchmark'}))
+
+            cache.clear()
+            with override_settings(LOGIN_LIMITE_CPF=1):
+                cliente.post('/api/user/login/', {'cpf': str(cpf), 'password': 'errada'})
+                self.medir('rejeitado pelo limite', options['requisicoes'] * 10, lambda: cliente.post(
+                    '/api/user/login/', {'cpf': str(cpf), 'password': 'errada'}))
+            cache.clear()
+
+            transaction.set_rollback(True)
+
+    def medir(self, nome, requisicoes, requisicao):
+        inicio = time.perf_counter()
+        for _ in range(requisicoes):
+            requisicao()
+        duracao = time.perf_counter() - inicio
+        self.stdout.write(f"{nome:<22} {requisicoes / duracao:>10.1f} {duracao / requisicoes * 1000:>10.2f}")
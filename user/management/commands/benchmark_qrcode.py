@@ -0,0 +1,38 @@
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from user.gerar_qrcode import gerar_qr_code, gerar_qr_codes_em_lote, FORMATOS, FORMATO_PNG
+
+
+class Command(BaseCommand):
+    help = "Mede a vazão da geração de QR Codes em lote para diferentes quantidades de processos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--quantidade', type=int, default=200)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8])
+        parser.add_argument('--formato', choices=[f[0] for f in FORMATOS], default=FORMATO_PNG)
+
+    def handle(self, *args, **options):
+        textos = [uuid.uuid4() for _ in range(options['quantidade'])]
+        formato = options['formato']
+
+        self.stdout.write(f"{'workers':>8} {'segundos':>10} {'qr/s':>10}")
+        for workers in options['workers']:
+            if workers <= 1:
+                inicio = time.perf_counter()
+                for texto in textos:
+                    gerar_qr_code(texto, formato=formato)
+                duracao = time.perf_counter() - inicio
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    # Aquece o pool para não medir o custo de criar os processos
+                    gerar_qr_codes_em_lote(textos[:workers], formato=formato, executor=executor)
+
+                    inicio = time.perf_counter()
+                    gerar_qr_codes_em_lote(textos, formato=formato, executor=executor)
+                    duracao = time.perf_counter() - inicio
+
+            self.stdout.write(f"{workers:>8} {duracao:>10.3f} {len(textos) / duracao:>10.1f}")
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.conciliacao import ler_extrato, conciliar
+from user.exportar import FORMATOS, FORMATO_CSV, FORMATO_JSONL
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia um extrato de PIX recebidos (CSV ou JSON Lines com os campos txid, valor e horario) "
+        "com os pedidos aguardando pagamento, marcando-os como pagos ou com valor divergente"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--formato', choices=[f[0] for f in FORMATOS],
+                            help="Padrão: deduzido da extensão do arquivo")
+        parser.add_argument('--lote', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        formato = options['formato'] or (FORMATO_JSONL if options['arquivo'].endswith('.jsonl') else FORMATO_CSV)
+
+        inicio = time.perf_counter()
+        # utf-8-sig: extratos exportados por bancos costumam vir com BOM
+        with open(options['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+            resultado = conciliar(ler_extrato(arquivo, formato), tamanho_lote=options['lote'])
+        duracao = time.perf_counter() - inicio
+
+        self.stdout.write(
+            f"{resultado['lidos']} lançamentos em {duracao:.2f}s: {resultado['pagos']} pagos, "
+            f"{resultado['divergentes']} com valor divergente, {resultado['sem_pedido']} sem pedido aguardando, "
+            f"{resultado['duplicados']} duplicados, {resultado['invalidos']} inválidos"
+        )
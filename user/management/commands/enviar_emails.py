@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.emails import enviar_emails_pendentes
+
+
+class Command(BaseCommand):
+    help = "Envia os e-mails pendentes da fila, em lotes, reaproveitando a conexão SMTP"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=50)
+        parser.add_argument('--continuo', action='store_true', help="Fica rodando e consultando a fila")
+        parser.add_argument('--intervalo', type=float, default=2, help="Segundos entre consultas à fila vazia")
+
+    def handle(self, *args, **options):
+        while True:
+            enviados = enviar_emails_pendentes(lote=options['lote'])
+            while enviados:
+                self.stdout.write(f"{enviados} e-mails processados")
+                enviados = enviar_emails_pendentes(lote=options['lote'])
+
+            if not options['continuo']:
+                break
+            time.sleep(options['intervalo'])
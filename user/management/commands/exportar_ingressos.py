@@ -0,0 +1,34 @@
+import sys
+
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime
+
+from user.exportar import filtrar_ingressos, exportar_ingressos, FORMATOS, FORMATO_CSV
+
+
+class Command(BaseCommand):
+    help = "Exporta ingressos e check-ins em CSV ou JSON Lines, em memória constante"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--formato', choices=[f[0] for f in FORMATOS], default=FORMATO_CSV)
+        parser.add_argument('--utilizado-de', type=parse_datetime, help="Data/hora ISO 8601")
+        parser.add_argument('--utilizado-ate', type=parse_datetime, help="Data/hora ISO 8601")
+        utilizados = parser.add_mutually_exclusive_group()
+        utilizados.add_argument('--utilizados', action='store_true', default=None)
+        utilizados.add_argument('--nao-utilizados', dest='utilizados', action='store_false')
+        parser.add_argument('--saida', help="Arquivo de saída (padrão: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        queryset = filtrar_ingressos(
+            utilizado_de=options['utilizado_de'],
+            utilizado_ate=options['utilizado_ate'],
+            utilizados=options['utilizados'],
+        )
+        linhas = exportar_ingressos(queryset, options['formato'], chunk_size=options['chunk_size'])
+
+        if options['saida']:
+            with open(options['saida'], 'w', encoding='utf-8', newline='') as arquivo:
+                arquivo.writelines(linhas)
+        else:
+            sys.stdout.writelines(linhas)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.importacao import ler_csv, importar_usuarios, CAMPOS
+
+
+class Command(BaseCommand):
+    help = (
+        f"Importa usuários pré-cadastrados de um CSV com as colunas {', '.join(CAMPOS)} (só o cpf é obrigatório). "
+        "Os usuários são criados sem senha e a definem no primeiro acesso. Quem já está cadastrado é "
+        "ignorado, então um arquivo interrompido no meio pode ser importado de novo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo')
+        parser.add_argument('--lote', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        inicio = time.perf_counter()
+
+        def progresso(resultado):
+            self.stdout.write(
+                f"{resultado['lidos']} linhas lidas, {resultado['importados']} importados "
+                f"({resultado['lidos'] / (time.perf_counter() - inicio):.0f} linhas/s)"
+            )
+
+        with open(options['arquivo'], encoding='utf-8-sig', newline='') as arquivo:
+            resultado = importar_usuarios(ler_csv(arquivo), tamanho_lote=options['lote'], progresso=progresso)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['importados']} usuários importados em {time.perf_counter() - inicio:.2f}s: "
+            f"{resultado['existentes']} já cadastrados, {resultado['duplicados']} duplicados no arquivo, "
+            f"{resultado['invalidos']} inválidos"
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from user.estoque import liberar_reservas_expiradas
+
+
+class Command(BaseCommand):
+    help = "Expira as reservas vencidas e devolve os ingressos ao estoque dos lotes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            liberadas = liberar_reservas_expiradas(limite=options['lote'])
+            if not liberadas:
+                break
+            total += liberadas
+
+        self.stdout.write(f"{total} reservas expiradas liberadas")
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.models import ChaveIdempotencia
+
+
+class Command(BaseCommand):
+    help = "Remove as chaves Idempotency-Key vencidas (criadas há mais de IDEMPOTENCIA_VALIDADE segundos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(seconds=settings.IDEMPOTENCIA_VALIDADE)
+        vencidas = ChaveIdempotencia.objects.filter(created_at__lt=limite)
+
+        total = 0
+        while True:
+            ids = list(vencidas.values_list('pk', flat=True)[:options['lote']])
+            if not ids:
+                break
+            ChaveIdempotencia.objects.filter(pk__in=ids).delete()
+            total += len(ids)
+
+        self.stdout.write(f"{total} chaves de idempotência removidas")
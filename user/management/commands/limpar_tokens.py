@@ -0,0 +1,29 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from user.models import TokenAcesso
+
+
+class Command(BaseCommand):
+    help = "Remove os tokens de acesso expirados (sem uso há mais de TOKEN_VALIDADE segundos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(seconds=settings.TOKEN_VALIDADE)
+        expirados = TokenAcesso.objects.filter(ultimo_uso__lt=limite)
+
+        # Em lotes para não segurar o lock da tabela nem carregar tudo em memória
+        total = 0
+        while True:
+            keys = list(expirados.values_list('key', flat=True)[:options['lote']])
+            if not keys:
+                break
+            TokenAcesso.objects.filter(key__in=keys).delete()
+            total += len(keys)
+
+        self.stdout.write(f"{total} tokens expirados removidos")
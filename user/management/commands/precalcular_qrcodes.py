@@ -0,0 +1,37 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user.gerar_qrcode import get_qr_code_cache, precalcular_qr_codes, LRUQrCodeCache, FORMATOS, FORMATO_PNG
+from user.models import Ingresso
+
+
+class Command(BaseCommand):
+    help = (
+        "Gera os QR Codes dos ingressos e guarda no cache compartilhado, fora das requisições. Rodar antes "
+        "da abertura dos portões, quando todos abrem os ingressos ao mesmo tempo"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--evento', help="Só os ingressos dos lotes deste evento")
+        parser.add_argument('--formato', choices=[f[0] for f in FORMATOS], action='append',
+                            help="Pode ser repetido (padrão: png)")
+        parser.add_argument('--lote', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        # No LRU do processo o resultado morreria junto com o comando
+        if isinstance(get_qr_code_cache(), LRUQrCodeCache):
+            raise CommandError("O cache de QR Codes é da memória do processo: configure CACHE_URL ou "
+                               "QRCODE_CACHE_BACKEND=user.gerar_qrcode.DjangoQrCodeCache.")
+
+        ingressos = Ingresso.objects.order_by()
+        if options['evento']:
+            ingressos = ingressos.filter(lote__evento_id=options['evento'])
+        ingressos = ingressos.values_list('pk', flat=True).iterator(chunk_size=options['lote'])
+
+        total = 0
+        while lote := list(islice(ingressos, options['lote'])):
+            precalcular_qr_codes(lote, formatos=options['formato'] or [FORMATO_PNG])
+            total += len(lote)
+            self.stdout.write(f"{total} ingressos")
+        self.stdout.write(self.style.SUCCESS(f"QR Codes de {total} ingressos no cache"))
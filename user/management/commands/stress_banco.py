@@ -0,0 +1,124 @@
+import logging
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.test import Client, override_settings
+from django.utils import timezone
+
+from user.cpf import completar_cpf
+from user.models import Usuario, TokenAcesso, UserType, Evento, Lote, Pagamento
+
+# Primeiros 9 dígitos dos CPFs gerados para o teste (o admin e um por thread)
+CPF_BASE = 999_990_000
+
+# O banco descartável não pode deixar tokens, CPFs ou o pagamento atual dele no cache compartilhado
+CACHE_DESCARTAVEL = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                 'LOCATION': 'stress_banco'}}
+
+
+class Command(BaseCommand):
+    help = (
+        "Teste de estresse de concorrência: várias threads comprando e validando ingressos ao mesmo tempo "
+        "pelos endpoints reais. Com SQLite sem WAL/timeout aparecem erros 'database is locked'. Roda num "
+        "banco descartável, criado e migrado como o dos testes (no SQLite, um arquivo temporário); "
+        "--banco-atual usa o banco configurado e remove ao final os usuários e ingressos criados."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--iteracoes', type=int, default=20)
+        parser.add_argument('--ingressos-por-compra', type=int, default=5)
+        parser.add_argument('--capacidade', type=int,
+                            help="Compra em um lote com essa capacidade e confere se houve venda além dela")
+        parser.add_argument('--banco-atual', action='store_true',
+                            help="Usa o banco configurado em vez de um descartável")
+
+    def handle(self, *args, **options):
+        if options['banco_atual']:
+            self.estressar(options)
+            return
+
+        with tempfile.TemporaryDirectory() as pasta, override_settings(CACHES=CACHE_DESCARTAVEL):
+            teste = connection.settings_dict['TEST']
+            nome_teste = teste['NAME']
+            if connection.vendor == 'sqlite':
+                # Em memória o SQLite não tem WAL nem os locks de arquivo que o teste quer exercitar
+                teste['NAME'] = os.path.join(pasta, 'stress.sqlite3')
+            else:
+                teste['NAME'] = f"stress_{connection.settings_dict['NAME']}"
+            nome_original = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+            try:
+                Pagamento.objects.create(chave='stress', valor=Decimal('10.00'))
+                self.estressar(options)
+            finally:
+                connection.creation.destroy_test_db(nome_original, verbosity=0)
+                teste['NAME'] = nome_teste
+
+    def estressar(self, options):
+        # Lote esgotado gera um aviso por compra recusada
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        cpfs = [completar_cpf(CPF_BASE + i) for i in range(options['threads'] + 1)]
+        existentes = list(Usuario.objects.filter(cpf__in=cpfs).values_list('cpf', flat=True))
+        if existentes:
+            raise CommandError(f"CPFs do teste já cadastrados no banco: {existentes}")
+        admin = Usuario.objects.create_user(password='!', cpf=cpfs[0], tipo=UserType.ADMIN)
+        compradores = [Usuario.objects.create_user(password='!', cpf=cpf) for cpf in cpfs[1:]]
+        token_admin = TokenAcesso.objects.create(usuario=admin).key
+        tokens = [TokenAcesso.objects.create(usuario=comprador).key for comprador in compradores]
+        erros = Counter()
+        compra = {'ingressos': [
+            {'nome': 'Stress', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}
+        ] * options['ingressos_por_compra']}
+        evento = None
+        if options['capacidade'] is not None:
+            evento = Evento.objects.create(nome='Stress', data=timezone.now())
+            lote = Lote.objects.create(evento=evento, nome='Stress', capacidade=options['capacidade'])
+            compra['lote'] = str(lote.pk)
+
+        def trabalhar(token):
+            cliente = Client(raise_request_exception=True)
+            for _ in range(options['iteracoes']):
+                try:
+                    resposta = cliente.post('/api/ingresso/payment/', compra, content_type='application/json',
+                                            HTTP_AUTHORIZATION=f'Token {token}')
+                    if resposta.status_code != 201:
+                        erros[f'HTTP {resposta.status_code}'] += 1
+                        continue
+                    for ingresso in resposta.json():
+                        cliente.post('/api/ingresso/validate/', {'ingresso': ingresso['id']},
+                                     content_type='application/json', HTTP_AUTHORIZATION=f'Token {token_admin}')
+                except OperationalError as erro:
+                    erros[str(erro)] += 1
+            connection.close()
+
+        inicio = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+                list(executor.map(trabalhar, tokens))
+        finally:
+            duracao = time.perf_counter() - inicio
+            if evento is not None:
+                lote.refresh_from_db()
+                vendidos = lote.ingressos.count()
+            Usuario.objects.filter(pk__in=[admin.pk] + [comprador.pk for comprador in compradores]).delete()
+            if evento is not None:
+                evento.delete()
+
+        total = options['threads'] * options['iteracoes']
+        self.stdout.write(f"{total} compras em {duracao:.2f}s com {options['threads']} threads")
+        if evento is not None:
+            estilo = self.style.SUCCESS if vendidos + lote.disponivel == lote.capacidade else self.style.ERROR
+            self.stdout.write(estilo(
+                f"Lote: capacidade {lote.capacidade}, vendidos {vendidos}, disponível {lote.disponivel}"
+            ))
+        if erros:
+            for mensagem, quantidade in erros.most_common():
+                self.stdout.write(self.style.ERROR(f"{quantidade}x {mensagem}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Nenhum erro de banco"))
@@ -0,0 +1,223 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotFound
+from django.utils.crypto import constant_time_compare
+
+BUCKETS_SEGUNDOS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+BUCKETS_QUERIES = (0, 1, 2, 5, 10, 20, 50, 100)
+BUCKETS_BYTES = (256, 1024, 10 * 1024, 100 * 1024, 1024 * 1024, 10 * 1024 * 1024)
+
+# Tempos acumulados da requisição atual, por componente, usados no cabeçalho Server-Timing
+_tempos = ContextVar('metricas_tempos', default=None)
+# Medidor de banco da requisição atual. O contexto acompanha a requisição nas threads do
+# sync_to_async, onde as views assíncronas fazem as queries com outras conexões
+_medidor_banco = ContextVar('metricas_banco', default=None)
+
+
+class Histograma:
+    def __init__(self, nome, descricao, buckets, rotulo):
+        self.nome = nome
+        self.descricao = descricao
+        self.buckets = buckets
+        self.rotulo = rotulo
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observar(self, valor, rotulo=''):
+        with self._lock:
+            serie = self._series.get(rotulo)
+            if serie is None:
+                serie = self._series[rotulo] = {'buckets': [0] * len(self.buckets), 'soma': 0, 'total': 0}
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie['buckets'][i] += 1
+            serie['soma'] += valor
+            serie['total'] += 1
+
+    def limpar(self):
+        with self._lock:
+            self._series.clear()
+
+    def exportar(self):
+        linhas = [f'# HELP {self.nome} {self.descricao}', f'# TYPE {self.nome} histogram']
+        with self._lock:
+            for rotulo, serie in sorted(self._series.items()):
+                prefixo = f'{self.rotulo}="{rotulo}",'
+                for limite, quantidade in zip(self.buckets, serie['buckets']):
+                    linhas.append(f'{self.nome}_bucket{{{prefixo}le="{limite}"}} {quantidade}')
+                linhas.append(f'{self.nome}_bucket{{{prefixo}le="+Inf"}} {serie["total"]}')
+                linhas.append(f'{self.nome}_sum{{{prefixo[:-1]}}} {serie["soma"]}')
+                linhas.append(f'{self.nome}_count{{{prefixo[:-1]}}} {serie["total"]}')
+        return linhas
+
+
+DURACAO = Histograma('ingressou_request_duration_seconds', "Tempo total da requisição",
+                     BUCKETS_SEGUNDOS, 'endpoint')
+DURACAO_BANCO = Histograma('ingressou_db_duration_seconds', "Tempo gasto no banco por requisição",
+                           BUCKETS_SEGUNDOS, 'endpoint')
+QUERIES = Histograma('ingressou_db_queries', "Queries executadas por requisição", BUCKETS_QUERIES, 'endpoint')
+TAMANHO = Histograma('ingressou_response_size_bytes', "Tamanho da resposta", BUCKETS_BYTES, 'endpoint')
+COMPONENTES = Histograma('ingressou_component_duration_seconds', "Tempo de trechos instrumentados",
+                         BUCKETS_SEGUNDOS, 'componente')
+
+HISTOGRAMAS = (DURACAO, DURACAO_BANCO, QUERIES, TAMANHO, COMPONENTES)
+
+
+def registrar_tempo(componente, duracao):
+    COMPONENTES.observar(duracao, componente)
+    tempos = _tempos.get()
+    if tempos is not None:
+        tempos[componente] = tempos.get(componente, 0) + duracao
+
+
+@contextmanager
+def medir_tempo(componente):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_tempo(componente, time.perf_counter() - inicio)
+
+
+def instrumentar(componente):
+    def decorator(funcao):
+        @functools.wraps(funcao)
+        def wrapper(*args, **kwargs):
+            with medir_tempo(componente):
+                return funcao(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MedidorBanco:
+    def __init__(self):
+        self.queries = 0
+        self.duracao = 0
+
+
+def medir_banco(execute, sql, params, many, context):
+    banco = _medidor_banco.get()
+    if banco is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        banco.duracao += time.perf_counter() - inicio
+        banco.queries += 1
+
+
+def instalar_medidor_banco(sender, connection, **kwargs):
+    # Fica em todas as conexões, de todas as threads; fora de uma requisição medida não faz nada.
+    # No início da lista, para não atrapalhar o append/pop de connection.execute_wrapper()
+    if medir_banco not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, medir_banco)
+
+
+def server_timing(tempos):
+    return ', '.join(f'{nome};dur={duracao * 1000:.2f}' for nome, duracao in tempos.items())
+
+
+class MetricasMiddleware:
+    # Mede cada requisição (tempo total, queries, tempo de banco e tamanho da resposta), agrega
+    # por endpoint nos histogramas e devolve os tempos no cabeçalho Server-Timing. Síncrono ou
+    # assíncrono conforme o restante da cadeia, para não forçar as views assíncronas por uma thread
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if not settings.METRICAS_ATIVAS:
+            return self.get_response(request)
+
+        tokens, medicao = self._iniciar()
+        try:
+            response = self.get_response(request)
+        finally:
+            self._encerrar(tokens)
+        return self._registrar(request, response, *medicao)
+
+    async def __acall__(self, request):
+        if not settings.METRICAS_ATIVAS:
+            return await self.get_response(request)
+
+        tokens, medicao = self._iniciar()
+        try:
+            response = await self.get_response(request)
+        finally:
+            self._encerrar(tokens)
+        return self._registrar(request, response, *medicao)
+
+    def _iniciar(self):
+        tempos, banco = {}, _MedidorBanco()
+        tokens = (_tempos.set(tempos), _medidor_banco.set(banco))
+        return tokens, (tempos, banco, time.perf_counter())
+
+    def _encerrar(self, tokens):
+        _tempos.reset(tokens[0])
+        _medidor_banco.reset(tokens[1])
+
+    def _registrar(self, request, response, tempos, banco, inicio):
+        total = time.perf_counter() - inicio
+        match = request.resolver_match
+        endpoint = match.view_name if match else 'desconhecido'
+        DURACAO.observar(total, endpoint)
+        DURACAO_BANCO.observar(banco.duracao, endpoint)
+        QUERIES.observar(banco.queries, endpoint)
+        if not response.streaming:
+            TAMANHO.observar(len(response.content), endpoint)
+
+        tempos['db'] = banco.duracao
+        tempos['total'] = total
+        response['Server-Timing'] = server_timing(tempos) + f', queries;desc="{banco.queries}"'
+        return response
+
+
+def exportar_metricas():
+    linhas = []
+    for histograma in HISTOGRAMAS:
+        linhas.extend(histograma.exportar())
+    return '\n'.join(linhas) + '\n'
+
+
+def limpar_metricas():
+    for histograma in HISTOGRAMAS:
+        histograma.limpar()
+
+
+def metricas(request):
+    # Os histogramas são do processo; com vários workers cada um deve ser coletado separadamente.
+    # Sem METRICAS_TOKEN o endpoint não existe
+    if not settings.METRICAS_TOKEN:
+        return HttpResponseNotFound()
+    autorizacao = request.headers.get('Authorization', '')
+    if not constant_time_compare(autorizacao, f'Bearer {settings.METRICAS_TOKEN}'):
+        return HttpResponseForbidden()
+    return HttpResponse(exportar_metricas(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class MetricasViewSetMixin:
+    # Separa, no Server-Timing e nos histogramas, o tempo de autenticação/permissões do tempo da ação
+    def initial(self, request, *args, **kwargs):
+        with medir_tempo('auth'):
+            super().initial(request, *args, **kwargs)
+        self._inicio_acao = time.perf_counter()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        inicio = getattr(self, '_inicio_acao', None)
+        if inicio is not None:
+            registrar_tempo(f'{self.basename}_{self.action}', time.perf_counter() - inicio)
+        return super().finalize_response(request, response, *args, **kwargs)
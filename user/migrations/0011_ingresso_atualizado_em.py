@@ -0,0 +1,20 @@
+# Generated by Django 5.0.7 on 2026-10-18 12:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0010_remove_ingresso_pago'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingresso',
+            name='atualizado_em',
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0011_ingresso_atualizado_em'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='ingresso',
+            name='usuario',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='ingressos', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='pagamento',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.AddIndex(
+            model_name='ingresso',
+            index=models.Index(fields=['usuario', 'created_at', 'id'], name='ingresso_usuario_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingresso',
+            index=models.Index(condition=models.Q(('utilizado_em__isnull', True)), fields=['created_at', 'id'], name='ingresso_nao_utilizado_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ingresso',
+            index=models.Index(condition=models.Q(('utilizado_em__isnull', False)), fields=['utilizado_em'], name='ingresso_utilizado_em_idx'),
+        ),
+    ]
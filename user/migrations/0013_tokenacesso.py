@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 15:50
+
+import django.db.models.deletion
+import django.utils.timezone
+import user.models
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0012_indices_ingresso_pagamento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenAcesso',
+            fields=[
+                ('key', models.CharField(default=user.models.gerar_chave_token, editable=False, max_length=40, primary_key=True, serialize=False)),
+                ('emitido_em', models.DateTimeField(auto_now_add=True)),
+                ('ultimo_uso', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['usuario', 'emitido_em'], name='token_usuario_emitido_idx')],
+            },
+        ),
+    ]
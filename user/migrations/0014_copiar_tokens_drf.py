@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.utils import timezone
+
+
+def copiar_tokens(apps, schema_editor):
+    # Mantém os usuários logados: cada token do DRF vira um TokenAcesso com o uso renovado agora
+    Token = apps.get_model('authtoken', 'Token')
+    TokenAcesso = apps.get_model('user', 'TokenAcesso')
+    agora = timezone.now()
+    TokenAcesso.objects.bulk_create([
+        TokenAcesso(key=token.key, usuario_id=token.user_id, ultimo_uso=agora)
+        for token in Token.objects.all().iterator()
+    ], batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0013_tokenacesso'),
+        ('authtoken', '0003_tokenproxy'),
+    ]
+
+    operations = [
+        migrations.RunPython(copiar_tokens, migrations.RunPython.noop),
+    ]
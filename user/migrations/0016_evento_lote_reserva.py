@@ -0,0 +1,61 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:06
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0015_emailpendente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Evento',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=200)),
+                ('data', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Lote',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('nome', models.CharField(max_length=200)),
+                ('capacidade', models.PositiveIntegerField()),
+                ('disponivel', models.PositiveIntegerField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('evento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lotes', to='user.evento')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingresso',
+            name='lote',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='ingressos', to='user.lote'),
+        ),
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('quantidade', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('ATIVA', 'Ativa'), ('CONFIRMADA', 'Confirmada'), ('EXPIRADA', 'Expirada')], default='ATIVA', max_length=20)),
+                ('expira_em', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('lote', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='user.lote')),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='lote',
+            constraint=models.CheckConstraint(check=models.Q(('disponivel__lte', models.F('capacidade'))), name='lote_disponivel_lte_capacidade'),
+        ),
+        migrations.AddIndex(
+            model_name='reserva',
+            index=models.Index(condition=models.Q(('status', 'ATIVA')), fields=['expira_em'], name='reserva_ativa_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:10
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0016_evento_lote_reserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChaveIdempotencia',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('chave', models.CharField(max_length=255)),
+                ('rota', models.CharField(max_length=100)),
+                ('hash_requisicao', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('PROCESSANDO', 'Processando'), ('CONCLUIDA', 'Concluída')], default='PROCESSANDO', max_length=20)),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('resposta', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chaves_idempotencia', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chaveidempotencia',
+            constraint=models.UniqueConstraint(fields=('usuario', 'chave'), name='idempotencia_usuario_chave_unica'),
+        ),
+    ]
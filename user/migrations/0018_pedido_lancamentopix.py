@@ -0,0 +1,50 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:17
+
+import django.db.models.deletion
+import user.models
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0017_chaveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LancamentoPix',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('txid', models.CharField(max_length=35, unique=True)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('horario', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Pedido',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('txid', models.CharField(default=user.models.gerar_txid, editable=False, max_length=35, unique=True)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('status', models.CharField(choices=[('AGUARDANDO', 'Aguardando pagamento'), ('PAGO', 'Pago'), ('DIVERGENTE', 'Valor pago divergente')], default='AGUARDANDO', max_length=20)),
+                ('valor_pago', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('pago_em', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('pagamento', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='pedidos', to='user.pagamento')),
+                ('usuario', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='pedidos', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='ingresso',
+            name='pedido',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingressos', to='user.pedido'),
+        ),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['usuario', 'created_at', 'id'], name='pedido_usuario_created_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.0.7 on 2026-10-18 16:44
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0018_pedido_lancamentopix'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngressoRemovido',
+            fields=[
+                ('id', models.UUIDField(editable=False, primary_key=True, serialize=False)),
+                ('lote_id', models.UUIDField(blank=True, null=True)),
+                ('removido_em', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,9 +1,17 @@
+import secrets
 import uuid
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MaxValueValidator
-from django.db import models
+from django.db import models, transaction
+from django.utils import timezone
+
+from user.cpf import normalizar_cpf, validar_cpf
 
 
 class CustomUserManager(BaseUserManager):
@@ -21,7 +29,9 @@ class CustomUserManager(BaseUserManager):
         return self.create_user(cpf=cpf, password=password, **extra_fields)
 
     def create_user(self, password, cpf, **extra_fields):
-        user = self.model(cpf=cpf, **extra_fields)
+        # Só cadastros novos verificam os dígitos: usuários antigos podem ter CPFs que não passam
+        validar_cpf(cpf)
+        user = self.model(cpf=normalizar_cpf(cpf), **extra_fields)
         user.set_password(password)
         user.save()
         return user
@@ -63,28 +73,315 @@ class UserSituation:
     )
 
 
+class ValidationStatus:
+    AUTORIZADO = "AUTORIZADO"
+    UTILIZADO = "UTILIZADO"
+    DESCONHECIDO = "DESCONHECIDO"
+
+    TYPES = (
+        (AUTORIZADO, "Autorizado"),
+        (UTILIZADO, "Já utilizado"),
+        (DESCONHECIDO, "Desconhecido"),
+    )
+
+
+class Evento(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    nome = models.CharField(max_length=200)
+    data = models.DateTimeField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.nome} - {self.data}'
+
+
+class Lote(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    evento = models.ForeignKey(Evento, on_delete=models.CASCADE, related_name="lotes")
+    nome = models.CharField(max_length=200)
+    capacidade = models.PositiveIntegerField()
+
+    # Ingressos ainda à venda: capacidade menos vendidos e reservados. Só é alterado por UPDATEs
+    # condicionais (ver user.estoque), nunca lido e regravado
+    disponivel = models.PositiveIntegerField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(check=models.Q(disponivel__lte=models.F('capacidade')),
+                                   name='lote_disponivel_lte_capacidade'),
+        ]
+
+    def clean(self):
+        super().clean()
+        if self._state.adding or self.capacidade is None:
+            return
+        atual = Lote.objects.filter(pk=self.pk).values('capacidade', 'disponivel').first()
+        if atual is not None and atual['capacidade'] - self.capacidade > atual['disponivel']:
+            minimo = atual['capacidade'] - atual['disponivel']
+            raise ValidationError({
+                'capacidade': f'{minimo} ingressos já foram vendidos ou reservados; a capacidade não pode ser menor.'
+            })
+
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            if self.disponivel is None:
+                self.disponivel = self.capacidade
+            return super().save(*args, **kwargs)
+
+        # Numa alteração, o disponível lido com a instância pode já estar desatualizado: grava os
+        # outros campos e aplica a diferença de capacidade com um UPDATE condicional
+        update_fields = kwargs.pop('update_fields', None)
+        if update_fields is None:
+            update_fields = [campo.name for campo in self._meta.concrete_fields if not campo.primary_key]
+        campos = [campo for campo in update_fields if campo not in ('capacidade', 'disponivel')]
+        with transaction.atomic():
+            if campos:
+                super().save(*args, update_fields=campos, **kwargs)
+            if 'capacidade' in update_fields:
+                self._aplicar_capacidade()
+
+    def _aplicar_capacidade(self):
+        alterados = Lote.objects.filter(pk=self.pk, disponivel__gte=models.F('capacidade') - self.capacidade).update(
+            capacidade=self.capacidade,
+            disponivel=models.F('disponivel') + self.capacidade - models.F('capacidade'),
+        )
+        if not alterados:
+            raise ValidationError({'capacidade': 'A capacidade não pode ser menor que os ingressos já vendidos.'})
+        self.disponivel = Lote.objects.values_list('disponivel', flat=True).get(pk=self.pk)
+
+    def __str__(self):
+        return f'{self.evento.nome} - {self.nome}'
+
+
+class ReservaStatus:
+    ATIVA = "ATIVA"
+    CONFIRMADA = "CONFIRMADA"
+    EXPIRADA = "EXPIRADA"
+
+    TYPES = (
+        (ATIVA, "Ativa"),
+        (CONFIRMADA, "Confirmada"),
+        (EXPIRADA, "Expirada"),
+    )
+
+
+class Reserva(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    lote = models.ForeignKey(Lote, on_delete=models.CASCADE, related_name="reservas")
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="reservas")
+    quantidade = models.PositiveIntegerField()
+    status = models.CharField(max_length=20, choices=ReservaStatus.TYPES, default=ReservaStatus.ATIVA)
+    expira_em = models.DateTimeField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expira_em'], name='reserva_ativa_idx',
+                         condition=models.Q(status="ATIVA")),
+        ]
+
+    def __str__(self):
+        return f'{self.usuario} - {self.lote} ({self.quantidade})'
+
+
+class PedidoStatus:
+    AGUARDANDO = "AGUARDANDO"
+    PAGO = "PAGO"
+    DIVERGENTE = "DIVERGENTE"
+
+    TYPES = (
+        (AGUARDANDO, "Aguardando pagamento"),
+        (PAGO, "Pago"),
+        (DIVERGENTE, "Valor pago divergente"),
+    )
+
+
+def gerar_txid():
+    # txid do PIX: de 26 a 35 caracteres alfanuméricos
+    return secrets.token_hex(16)
+
+
+class Pedido(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="pedidos", db_index=False)
+    pagamento = models.ForeignKey('Pagamento', on_delete=models.PROTECT, related_name="pedidos",
+                                  null=True, blank=True)
+    txid = models.CharField(max_length=35, unique=True, default=gerar_txid, editable=False)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=20, choices=PedidoStatus.TYPES, default=PedidoStatus.AGUARDANDO)
+
+    valor_pago = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    pago_em = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'created_at', 'id'], name='pedido_usuario_created_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.txid} - {self.valor} - {self.status}'
+
+
+class LancamentoPix(models.Model):
+    # PIX recebido, como veio no extrato. O txid único faz reprocessar o mesmo extrato não ter efeito
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    txid = models.CharField(max_length=35, unique=True)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    horario = models.DateTimeField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.txid} - {self.valor}'
+
+
 class Ingresso(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
 
-    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="ingressos")
+    # Coberto pelo índice composto (usuario, created_at, id)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="ingressos", db_index=False)
     nome = models.CharField(max_length=200)
     data_nascimento = models.DateField()
     situacao = models.CharField(max_length=100, choices=UserSituation.TYPES, default=UserSituation.SOLTEIRO)
+    lote = models.ForeignKey(Lote, on_delete=models.PROTECT, related_name="ingressos", null=True, blank=True)
+    pedido = models.ForeignKey(Pedido, on_delete=models.SET_NULL, related_name="ingressos", null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     utilizado_em = models.DateTimeField(null=True, blank=True)
+    atualizado_em = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Listagem paginada por cursor dos ingressos do usuário
+            models.Index(fields=['usuario', 'created_at', 'id'], name='ingresso_usuario_created_idx'),
+            # Índices parciais complementares: ingressos ainda não utilizados em ordem de
+            # criação, e check-ins por horário
+            models.Index(fields=['created_at', 'id'], name='ingresso_nao_utilizado_idx',
+                         condition=models.Q(utilizado_em__isnull=True)),
+            models.Index(fields=['utilizado_em'], name='ingresso_utilizado_em_idx',
+                         condition=models.Q(utilizado_em__isnull=False)),
+        ]
 
     def __str__(self):
         return f'{self.usuario} - {self.created_at}'
 
 
+class IngressoRemovido(models.Model):
+    # Registro de um ingresso apagado, para o delta do snapshot avisar os leitores da portaria
+    id = models.UUIDField(primary_key=True, editable=False)
+    lote_id = models.UUIDField(null=True, blank=True)
+    removido_em = models.DateTimeField(default=timezone.now, db_index=True)
+
+    def __str__(self):
+        return f'{self.id} - {self.removido_em}'
+
+
 class Pagamento(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     chave = models.TextField(unique=True)
     valor = models.DecimalField(max_digits=10, decimal_places=2)
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f'{self.chave} - {self.valor}'
 
+
+def gerar_chave_token():
+    return secrets.token_hex(20)
+
+
+class TokenAcesso(models.Model):
+    key = models.CharField(max_length=40, primary_key=True, default=gerar_chave_token, editable=False)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="tokens", db_index=False)
+
+    emitido_em = models.DateTimeField(auto_now_add=True)
+    ultimo_uso = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['usuario', 'emitido_em'], name='token_usuario_emitido_idx'),
+        ]
+
+    @property
+    def expira_em(self):
+        return self.ultimo_uso + timedelta(seconds=settings.TOKEN_VALIDADE)
+
+    def __str__(self):
+        return f'{self.usuario} - {self.emitido_em}'
+
+
+class EmailStatus:
+    PENDENTE = "PENDENTE"
+    ENVIADO = "ENVIADO"
+    FALHOU = "FALHOU"
+
+    TYPES = (
+        (PENDENTE, "Pendente"),
+        (ENVIADO, "Enviado"),
+        (FALHOU, "Falhou"),
+    )
+
+
+class EmailPendente(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    assunto = models.CharField(max_length=255)
+    mensagem = models.TextField()
+    remetente = models.CharField(max_length=255)
+    destinatarios = models.JSONField()
+
+    status = models.CharField(max_length=20, choices=EmailStatus.TYPES, default=EmailStatus.PENDENTE)
+    tentativas = models.PositiveIntegerField(default=0)
+    proxima_tentativa = models.DateTimeField(default=timezone.now)
+    erro = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    enviado_em = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['proxima_tentativa'], name='email_pendente_idx',
+                         condition=models.Q(status="PENDENTE")),
+        ]
+
+    def __str__(self):
+        return f'{self.assunto} - {self.status}'
+
+
+class IdempotenciaStatus:
+    PROCESSANDO = "PROCESSANDO"
+    CONCLUIDA = "CONCLUIDA"
+
+    TYPES = (
+        (PROCESSANDO, "Processando"),
+        (CONCLUIDA, "Concluída"),
+    )
+
+
+class ChaveIdempotencia(models.Model):
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Coberto pela restrição única (usuario, chave)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name="chaves_idempotencia",
+                                db_index=False)
+    chave = models.CharField(max_length=255)
+    rota = models.CharField(max_length=100)
+    hash_requisicao = models.CharField(max_length=64)
+
+    status = models.CharField(max_length=20, choices=IdempotenciaStatus.TYPES, default=IdempotenciaStatus.PROCESSANDO)
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    resposta = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'chave'], name='idempotencia_usuario_chave_unica'),
+        ]
+
+    def __str__(self):
+        return f'{self.usuario} - {self.chave} - {self.status}'
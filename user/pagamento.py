@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from user.models import Pagamento
+
+CHAVE_PAGAMENTO_ATUAL = 'pagamento:atual'
+
+# Guardado no cache quando não existe pagamento cadastrado, para não consultar o banco toda vez
+_SEM_PAGAMENTO = 'sem-pagamento'
+
+
+def buscar_pagamento_atual():
+    # Direto do banco: a compra usa este, para nunca cobrar um preço que outro processo ainda tem em cache
+    return Pagamento.objects.order_by('-created_at').first()
+
+
+def get_pagamento_atual():
+    pagamento = cache.get(CHAVE_PAGAMENTO_ATUAL)
+    if pagamento is None:
+        pagamento = buscar_pagamento_atual() or _SEM_PAGAMENTO
+        cache.set(CHAVE_PAGAMENTO_ATUAL, pagamento, timeout=settings.PAGAMENTO_CACHE_TIMEOUT)
+    if pagamento == _SEM_PAGAMENTO:
+        return None
+    return pagamento
+
+
+def invalidar_pagamento_atual(**kwargs):
+    cache.delete(CHAVE_PAGAMENTO_ATUAL)
@@ -0,0 +1,18 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination
+
+
+class CreatedAtCursorPagination(CursorPagination):
+    # Paginação por chave (created_at, id): o custo de cada página não depende
+    # de quantas páginas vieram antes, ao contrário de OFFSET
+    ordering = ('-created_at', '-id')
+    page_size = settings.PAGINACAO_TAMANHO_PAGINA
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class UsuarioCursorPagination(CreatedAtCursorPagination):
+    # O DRF só usa o primeiro campo da ordenação na posição do cursor, então ele precisa ser único:
+    # com date_joined repetido, usuários seriam pulados ou repetidos entre as páginas. O CPF é único
+    # e já tem índice pela restrição de unicidade
+    ordering = 'cpf'
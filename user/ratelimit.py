@@ -0,0 +1,80 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+
+class LimiteTentativas:
+    """Janela deslizante aproximada, guardada no cache: duas janelas fixas consecutivas, com a
+    anterior pesando proporcionalmente ao quanto ainda se sobrepõe à janela deslizante. Só vale
+    entre workers com o cache padrão compartilhado (CACHE_URL)."""
+
+    def __init__(self, prefixo, limite, janela):
+        self.prefixo = prefixo
+        self.limite = limite
+        self.janela = janela
+
+    def _chaves(self, identificador, agora):
+        # O identificador vem do cliente: o hash mantém a chave curta e sem caracteres inválidos
+        identificador = hashlib.sha256(str(identificador).encode('utf-8')).hexdigest()[:32]
+        atual = int(agora // self.janela)
+        return (
+            f'ratelimit:{self.prefixo}:{identificador}:{atual}',
+            f'ratelimit:{self.prefixo}:{identificador}:{atual - 1}',
+        )
+
+    def tentativas(self, identificador):
+        agora = time.time()
+        chave_atual, chave_anterior = self._chaves(identificador, agora)
+        contagens = cache.get_many([chave_atual, chave_anterior])
+        sobreposicao = 1 - (agora % self.janela) / self.janela
+        return contagens.get(chave_atual, 0) + contagens.get(chave_anterior, 0) * sobreposicao
+
+    def excedido(self, identificador):
+        return self.tentativas(identificador) >= self.limite
+
+    def registrar(self, identificador):
+        chave_atual, _ = self._chaves(identificador, time.time())
+        # add + incr para não perder contagens entre processos concorrentes
+        if not cache.add(chave_atual, 1, timeout=self.janela * 2):
+            try:
+                cache.incr(chave_atual)
+            except ValueError:
+                cache.set(chave_atual, 1, timeout=self.janela * 2)
+
+    def limpar(self, identificador):
+        cache.delete_many(self._chaves(identificador, time.time()))
+
+    # Versões para as views assíncronas. Os backends de cache do Django só têm métodos async que
+    # passam pela thread única do sync_to_async; aqui não há banco, então cada chamada vai para
+    # uma thread própria e as requisições não ficam enfileiradas umas atrás das outras
+    async def aexcedido(self, identificador):
+        return await sync_to_async(self.excedido, thread_sensitive=False)(identificador)
+
+    async def aregistrar(self, identificador):
+        await sync_to_async(self.registrar, thread_sensitive=False)(identificador)
+
+    async def alimpar(self, identificador):
+        await sync_to_async(self.limpar, thread_sensitive=False)(identificador)
+
+
+def limite_login_cpf():
+    return LimiteTentativas('login:cpf', settings.LOGIN_LIMITE_CPF, settings.LOGIN_JANELA_SEGUNDOS)
+
+
+def limite_login_ip():
+    return LimiteTentativas('login:ip', settings.LOGIN_LIMITE_IP, settings.LOGIN_JANELA_SEGUNDOS)
+
+
+def obter_ip(request):
+    # Cada proxy acrescenta ao fim do X-Forwarded-For o endereço de quem o chamou; o começo do
+    # cabeçalho vem do cliente e pode ser qualquer coisa. Com N proxies confiáveis, o IP do cliente
+    # é o N-ésimo a partir do fim
+    proxies = settings.LOGIN_PROXIES_CONFIAVEIS
+    if proxies > 0:
+        encaminhado = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+        if len(encaminhado) >= proxies:
+            return encaminhado[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
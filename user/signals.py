@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete
+
+from user.authentication import invalidar_token, invalidar_tokens_usuario
+from user.cache import invalidar_com_commit
+from user.cpf import invalidar_cpfs
+from user.metricas import instalar_medidor_banco
+from user.models import Pagamento, Usuario, TokenAcesso, Ingresso, IngressoRemovido
+from user.pagamento import invalidar_pagamento_atual
+
+
+def invalidar_token_removido(sender, instance, **kwargs):
+    invalidar_com_commit(invalidar_token, instance.key)
+
+
+def invalidar_tokens_usuario_alterado(sender, instance, created=False, **kwargs):
+    # Senha, is_active ou dados do usuário mudaram: o usuário guardado junto com o token ficou velho
+    if not created:
+        invalidar_com_commit(invalidar_tokens_usuario, instance.pk)
+
+
+def invalidar_pagamento_alterado(sender, **kwargs):
+    invalidar_com_commit(invalidar_pagamento_atual)
+
+
+def invalidar_cpf_usuario(sender, instance, **kwargs):
+    # Cadastro (entrada negativa), primeiro acesso e esqueci a senha mudam o que validate_cpf responde
+    invalidar_com_commit(invalidar_cpfs, [instance.cpf])
+
+
+def registrar_ingresso_removido(sender, instance, **kwargs):
+    IngressoRemovido.objects.create(id=instance.pk, lote_id=instance.lote_id)
+
+
+# Bancos SQLite que já tiveram o journal_mode aplicado neste processo
+_journal_configurado = set()
+
+
+def configurar_sqlite(sender, connection, **kwargs):
+    # WAL deixa leituras acontecerem durante uma escrita; a espera das escritas concorrentes pelo
+    # lock é o 'timeout' das OPTIONS do banco. O journal_mode persiste no arquivo, então só precisa
+    # ser aplicado na primeira conexão
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        nome = connection.settings_dict['NAME']
+        if nome not in _journal_configurado:
+            cursor.execute(f'PRAGMA journal_mode = {settings.SQLITE_JOURNAL_MODE}')
+            _journal_configurado.add(nome)
+        for pragma, valor in settings.SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
+
+
+def conectar_sinais():
+    post_save.connect(invalidar_pagamento_alterado, sender=Pagamento, dispatch_uid='invalidar_pagamento_atual_save')
+    post_delete.connect(invalidar_pagamento_alterado, sender=Pagamento, dispatch_uid='invalidar_pagamento_atual_delete')
+    post_delete.connect(invalidar_token_removido, sender=TokenAcesso, dispatch_uid='invalidar_token_removido')
+    post_save.connect(invalidar_tokens_usuario_alterado, sender=Usuario, dispatch_uid='invalidar_tokens_usuario_alterado')
+    post_save.connect(invalidar_cpf_usuario, sender=Usuario, dispatch_uid='invalidar_cpf_usuario_save')
+    post_delete.connect(invalidar_cpf_usuario, sender=Usuario, dispatch_uid='invalidar_cpf_usuario_delete')
+    post_delete.connect(registrar_ingresso_removido, sender=Ingresso, dispatch_uid='registrar_ingresso_removido')
+    connection_created.connect(configurar_sqlite, dispatch_uid='configurar_sqlite')
+    connection_created.connect(instalar_medidor_banco, dispatch_uid='instalar_medidor_banco')
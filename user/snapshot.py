@@ -0,0 +1,103 @@
+import base64
+import hashlib
+import hmac
+from datetime import timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+
+from user.models import Ingresso, IngressoRemovido, Lote
+
+SNAPSHOT_VERSAO = 2
+
+
+def empacotar_ids(ids):
+    # UUIDs em binário (16 bytes cada) e ordenados: o leitor consulta com busca binária
+    return b''.join(sorted(ingresso_id.bytes for ingresso_id in ids))
+
+
+def _chave_assinatura():
+    # A chave fica nos leitores da portaria: não pode ser o SECRET_KEY, que assina sessões e
+    # links de redefinição de senha
+    chave = settings.SNAPSHOT_SIGNING_KEY
+    if not chave or chave == settings.SECRET_KEY:
+        raise ImproperlyConfigured("Defina SNAPSHOT_SIGNING_KEY com uma chave exclusiva dos leitores.")
+    return chave.encode('utf-8')
+
+
+def assinar(*partes):
+    assinatura = hmac.new(_chave_assinatura(), digestmod=hashlib.sha256)
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        assinatura.update(len(parte).to_bytes(8, 'big'))
+        assinatura.update(parte)
+    return assinatura.hexdigest()
+
+
+def _partes(dados):
+    return (
+        str(dados['versao']),
+        dados['evento'] or '',
+        dados['cursor'],
+        base64.b64decode(dados['validos']),
+        base64.b64decode(dados['utilizados']),
+        base64.b64decode(dados['removidos']),
+    )
+
+
+def verificar_assinatura(dados):
+    # Mesma conferência que o leitor faz antes de aplicar um snapshot ou delta
+    return hmac.compare_digest(assinar(*_partes(dados)), dados['assinatura'])
+
+
+def _gerar(queryset, removidos, cursor, evento):
+    validos = []
+    utilizados = []
+    for ingresso_id, utilizado_em in queryset.values_list('pk', 'utilizado_em').iterator(chunk_size=2000):
+        if utilizado_em is None:
+            validos.append(ingresso_id)
+        else:
+            utilizados.append(ingresso_id)
+
+    # Sempre em UTC com 'Z', para o cursor poder ir na query string sem escapar o '+'
+    dados = {
+        "versao": SNAPSHOT_VERSAO,
+        "evento": str(evento) if evento else None,
+        "cursor": cursor.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+        "validos": base64.b64encode(empacotar_ids(validos)).decode('utf-8'),
+        "utilizados": base64.b64encode(empacotar_ids(utilizados)).decode('utf-8'),
+        "removidos": base64.b64encode(empacotar_ids(removidos)).decode('utf-8'),
+    }
+    dados["assinatura"] = assinar(*_partes(dados))
+    return dados
+
+
+def proximo_cursor():
+    # Recua o cursor para não perder alterações de transações que ainda não
+    # tinham feito commit; o leitor recebe algumas linhas repetidas, o que é inofensivo
+    margem = getattr(settings, 'SNAPSHOT_MARGEM_SEGUNDOS', 10)
+    return timezone.now() - timedelta(seconds=margem)
+
+
+def _ingressos(evento):
+    if evento is None:
+        return Ingresso.objects.all()
+    return Ingresso.objects.filter(lote__evento_id=evento)
+
+
+def gerar_snapshot(evento=None):
+    cursor = proximo_cursor()
+    return _gerar(_ingressos(evento), [], cursor, evento)
+
+
+def gerar_delta(desde, evento=None):
+    # Ingressos apagados não aparecem no filtro por atualizado_em: vão na lista de removidos,
+    # que o leitor tira dos válidos
+    cursor = proximo_cursor()
+    removidos = IngressoRemovido.objects.filter(removido_em__gte=desde)
+    if evento is not None:
+        removidos = removidos.filter(lote_id__in=Lote.objects.filter(evento_id=evento).values('pk'))
+    return _gerar(_ingressos(evento).filter(atualizado_em__gte=desde),
+                  removidos.values_list('pk', flat=True), cursor, evento)
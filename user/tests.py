@@ -1,3 +1,1216 @@
-from django.test import TestCase
+import base64
+import csv
+import json
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
+from decimal import Decimal
+from unittest import mock
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, AsyncClient, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.core.management import call_command, CommandError
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from user.authentication import CachedTokenAuthentication, chave_token
+from user.benchmark import comparar
+from user.conciliacao import conciliar
+from user.cpf import completar_cpf
+from user.emails import enviar_emails_pendentes
+from user.gerar_qrcode import obter_qr_code, obter_qr_codes, gerar_qr_code, gerar_qr_code_matriz, \
+    gerar_qr_codes_em_lote, reset_qr_code_cache
+from user.hashers import TunedPBKDF2PasswordHasher
+from user.importacao import importar_usuarios, senha_inutilizavel
+from user.management.commands.stress_banco import CPF_BASE
+from user.metricas import MetricasMiddleware, limpar_metricas
+from user.snapshot import gerar_snapshot, verificar_assinatura
+from user.models import Usuario, Ingresso, UserType, Pagamento, TokenAcesso, EmailPendente, EmailStatus, Evento, \
+    Lote, Reserva, ReservaStatus, ValidationStatus, ChaveIdempotencia, Pedido, PedidoStatus, \
+    LancamentoPix
+
+
+class QueryCountTestCase(TestCase):
+    # Garante que a quantidade de queries de cada endpoint não cresce com a
+    # quantidade de ingressos (N+1)
+
+    @contextmanager
+    def assertMaxQueries(self, maximo):
+        with CaptureQueriesContext(connection) as contexto:
+            yield contexto
+        executadas = len(contexto.captured_queries)
+        self.assertLessEqual(
+            executadas, maximo,
+            f"{executadas} queries executadas, máximo {maximo}:\n" +
+            "\n".join(query['sql'] for query in contexto.captured_queries)
+        )
+
+    def setUp(self):
+        # Pagamento atual e tokens ficam em cache entre os testes, mas as linhas são desfeitas
+        cache.clear()
+        self.usuario = Usuario.objects.create_user(password='senha', cpf=12345678909, first_name='Fulano',
+                                                   last_name='Silva', email='fulano@ingressou.com')
+        self.admin = Usuario.objects.create_user(password='senha', cpf=98765432100, tipo=UserType.ADMIN,
+                                                 email='admin@ingressou.com')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {TokenAcesso.objects.create(usuario=self.usuario).key}')
+        self.admin_client = APIClient()
+        self.admin_client.credentials(HTTP_AUTHORIZATION=f'Token {TokenAcesso.objects.create(usuario=self.admin).key}')
+
+    def criar_ingressos(self, quantidade):
+        return Ingresso.objects.bulk_create([
+            Ingresso(usuario=self.usuario, nome=f'Ingresso {i}', data_nascimento='2000-01-01')
+            for i in range(quantidade)
+        ])
+
+
+class IngressoQueryCountTest(QueryCountTestCase):
+
+    def test_list(self):
+        self.criar_ingressos(20)
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/ingresso/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 20)
+
+    def test_retrieve(self):
+        ingresso = self.criar_ingressos(1)[0]
+        with self.assertMaxQueries(2):
+            response = self.client.get(f'/api/ingresso/{ingresso.pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_payment(self):
+        ingresso = {'nome': 'Ciclano', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}
+        Pagamento.objects.create(chave='chave', valor=Decimal('10.00'))
+        # Inclui as consultas que conferem que nenhum lote foi cadastrado e leem o preço atual
+        with self.assertMaxQueries(7):
+            response = self.client.post('/api/ingresso/payment/', {'ingressos': [ingresso] * 15}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.json()), 15)
+
+    def test_payment_sem_pagamento(self):
+        ingresso = {'nome': 'Ciclano', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}
+        response = self.client.post('/api/ingresso/payment/', {'ingressos': [ingresso]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(Ingresso.objects.exists())
+
+    def test_meus_ingressos(self):
+        self.criar_ingressos(10)
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/ingresso/meus_ingressos/?formato=bits')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['ingressos']), 10)
+
+    def test_validate(self):
+        ingresso = self.criar_ingressos(1)[0]
+        with self.assertMaxQueries(2):
+            response = self.admin_client.post('/api/ingresso/validate/', {'ingresso': str(ingresso.pk)},
+                                              format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_validate_lote(self):
+        ingressos = self.criar_ingressos(50)
+        leituras = [{'ingresso': str(ingresso.pk)} for ingresso in ingressos]
+        with self.assertMaxQueries(5):
+            response = self.admin_client.post('/api/ingresso/validate_lote/', {'leituras': leituras},
+                                              format='json')
+        self.assertEqual(response.status_code, 200)
+
+
+class ValidateTest(QueryCountTestCase):
+
+    def validar(self, ingresso_id):
+        return self.admin_client.post('/api/ingresso/validate/', {'ingresso': str(ingresso_id)}, format='json')
+
+    def test_ingresso_ja_utilizado(self):
+        ingresso = self.criar_ingressos(1)[0]
+        self.assertEqual(self.validar(ingresso.pk).status_code, 200)
+        utilizado_em = Ingresso.objects.get(pk=ingresso.pk).utilizado_em
+
+        response = self.validar(ingresso.pk)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'msg': 'Ingresso já utilizado'})
+        self.assertEqual(Ingresso.objects.get(pk=ingresso.pk).utilizado_em, utilizado_em)
+
+    def test_ingresso_inexistente(self):
+        self.assertEqual(self.validar('00000000-0000-0000-0000-000000000000').status_code, 404)
+
+    def test_usuario_comum(self):
+        ingresso = self.criar_ingressos(1)[0]
+        response = self.client.post('/api/ingresso/validate/', {'ingresso': str(ingresso.pk)}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertIsNone(Ingresso.objects.get(pk=ingresso.pk).utilizado_em)
+
+
+class ValidateLoteTest(QueryCountTestCase):
+
+    def validar(self, leituras):
+        response = self.admin_client.post('/api/ingresso/validate_lote/', {'leituras': leituras}, format='json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_status_por_ingresso(self):
+        valido, utilizado = self.criar_ingressos(2)
+        self.validar([{'ingresso': str(utilizado.pk)}])
+        inexistente = '00000000-0000-0000-0000-000000000000'
+
+        resultados = self.validar([
+            {'ingresso': str(valido.pk)},
+            {'ingresso': str(utilizado.pk)},
+            {'ingresso': inexistente},
+        ])
+        self.assertEqual([resultado['status'] for resultado in resultados],
+                         [ValidationStatus.AUTORIZADO, ValidationStatus.UTILIZADO, ValidationStatus.DESCONHECIDO])
+        self.assertIsNotNone(resultados[1]['utilizado_em'])
+        self.assertIsNone(resultados[2]['utilizado_em'])
+
+    def test_ingresso_repetido_no_lote(self):
+        # Dois leitores offline leram o mesmo ingresso: vale a leitura mais antiga
+        ingresso = self.criar_ingressos(1)[0]
+        resultados = self.validar([
+            {'ingresso': str(ingresso.pk), 'lido_em': '01/01/2026 20:05:00'},
+            {'ingresso': str(ingresso.pk), 'lido_em': '01/01/2026 20:00:00'},
+        ])
+        self.assertEqual([resultado['status'] for resultado in resultados],
+                         [ValidationStatus.AUTORIZADO, ValidationStatus.UTILIZADO])
+        self.assertEqual({resultado['utilizado_em'] for resultado in resultados}, {'01/01/2026 20:00:00'})
+
+    def test_leitura_no_futuro(self):
+        ingresso = self.criar_ingressos(1)[0]
+        self.validar([{'ingresso': str(ingresso.pk), 'lido_em': '01/01/2100 00:00:00'}])
+        self.assertLessEqual(Ingresso.objects.get(pk=ingresso.pk).utilizado_em, timezone.now())
+
+
+class ValidateConcorrenteTest(TransactionTestCase):
+
+    def test_validacao_dupla_concorrente(self):
+        admin = Usuario.objects.create_user(password='senha', cpf=98765432100, tipo=UserType.ADMIN)
+        token = TokenAcesso.objects.create(usuario=admin).key
+        ingresso = Ingresso.objects.create(usuario=admin, nome='Ingresso', data_nascimento='2000-01-01')
+        leitores = 4
+        largada = threading.Barrier(leitores)
+
+        def validar(_):
+            # Os leitores da portaria leem o mesmo ingresso ao mesmo tempo
+            cliente = APIClient()
+            cliente.credentials(HTTP_AUTHORIZATION=f'Token {token}')
+            largada.wait()
+            try:
+                return cliente.post('/api/ingresso/validate/', {'ingresso': str(ingresso.pk)},
+                                    format='json').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=leitores) as executor:
+            resultados = sorted(executor.map(validar, range(leitores)))
+        self.assertEqual(resultados, [200] + [400] * (leitores - 1))
+
+
+class StressBancoTest(TransactionTestCase):
+
+    def test_banco_atual(self):
+        Pagamento.objects.create(chave='chave', valor=Decimal('10.00'))
+        saida = StringIO()
+        call_command('stress_banco', '--banco-atual', threads=2, iteracoes=2, ingressos_por_compra=2,
+                     capacidade=6, stdout=saida)
+        self.assertIn('capacidade 6, vendidos 6, disponível 0', saida.getvalue())
+        # Os usuários e o lote do teste são removidos
+        self.assertFalse(Usuario.objects.exists())
+        self.assertFalse(Ingresso.objects.exists())
+
+    def test_banco_atual_nao_usa_cpf_cadastrado(self):
+        Usuario.objects.create_user(password='senha', cpf=completar_cpf(CPF_BASE + 1))
+        with self.assertRaises(CommandError):
+            call_command('stress_banco', '--banco-atual', threads=2, iteracoes=1, stdout=StringIO())
+        self.assertEqual(Usuario.objects.count(), 1)
+
+
+class ExportarTest(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.nao_utilizado, self.cedo, self.tarde = self.criar_ingressos(3)
+        Ingresso.objects.filter(pk=self.cedo.pk).update(utilizado_em='2026-01-01T20:00:00-03:00')
+        Ingresso.objects.filter(pk=self.tarde.pk).update(utilizado_em='2026-01-01T23:00:00-03:00')
+
+    def exportar(self, **parametros):
+        response = self.admin_client.get('/api/ingresso/exportar/', parametros)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv(self):
+        response, conteudo = self.exportar()
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="ingressos.csv"')
+        linhas = list(csv.DictReader(StringIO(conteudo)))
+        self.assertEqual([linha['id'] for linha in linhas],
+                         [str(self.nao_utilizado.pk), str(self.cedo.pk), str(self.tarde.pk)])
+        self.assertEqual(linhas[0]['usuario__cpf'], '12345678909')
+        self.assertEqual(linhas[0]['utilizado_em'], '')
+
+    def test_jsonl(self):
+        response, conteudo = self.exportar(formato='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        linhas = [json.loads(linha) for linha in conteudo.splitlines()]
+        self.assertEqual(len(linhas), 3)
+        self.assertEqual(linhas[0]['usuario__email'], 'fulano@ingressou.com')
+        self.assertIsNone(linhas[0]['utilizado_em'])
+        self.assertTrue(linhas[1]['utilizado_em'].startswith('2026-01-01T23:00:00'))
+
+    def exportados(self, **filtros):
+        _, conteudo = self.exportar(formato='jsonl', **filtros)
+        return {json.loads(linha)['id'] for linha in conteudo.splitlines()}
+
+    def test_filtros(self):
+        self.assertEqual(self.exportados(utilizados='true'), {str(self.cedo.pk), str(self.tarde.pk)})
+        self.assertEqual(self.exportados(utilizados='false'), {str(self.nao_utilizado.pk)})
+        self.assertEqual(self.exportados(utilizado_de='01/01/2026 21:00:00'), {str(self.tarde.pk)})
+        self.assertEqual(self.exportados(utilizado_ate='2026-01-01T21:00:00-03:00'), {str(self.cedo.pk)})
+
+    def test_usuario_comum(self):
+        self.assertEqual(self.client.get('/api/ingresso/exportar/').status_code, 401)
+
+    def test_comando(self):
+        with tempfile.NamedTemporaryFile('r', suffix='.csv') as arquivo:
+            call_command('exportar_ingressos', '--nao-utilizados', saida=arquivo.name)
+            linhas = list(csv.DictReader(arquivo))
+        self.assertEqual([linha['id'] for linha in linhas], [str(self.nao_utilizado.pk)])
+
+
+@override_settings(SNAPSHOT_SIGNING_KEY='chave-dos-leitores')
+class SnapshotTest(QueryCountTestCase):
+
+    def ids(self, dados, campo):
+        empacotados = base64.b64decode(dados[campo])
+        return {empacotados[i:i + 16] for i in range(0, len(empacotados), 16)}
+
+    def test_snapshot_assinado(self):
+        valido, utilizado = self.criar_ingressos(2)
+        Ingresso.objects.filter(pk=utilizado.pk).update(utilizado_em=timezone.now())
+
+        response = self.admin_client.get('/api/ingresso/snapshot/')
+        self.assertEqual(response.status_code, 200)
+        dados = response.json()
+        self.assertTrue(verificar_assinatura(dados))
+        self.assertEqual(self.ids(dados, 'validos'), {valido.pk.bytes})
+        self.assertEqual(self.ids(dados, 'utilizados'), {utilizado.pk.bytes})
+
+    def test_adulteracao_rejeitada(self):
+        valido, utilizado = self.criar_ingressos(2)
+        Ingresso.objects.filter(pk=utilizado.pk).update(utilizado_em=timezone.now())
+        dados = gerar_snapshot()
+
+        # Ingresso utilizado movido de volta para os válidos
+        adulterado = dict(dados, validos=base64.b64encode(base64.b64decode(dados['validos']) + utilizado.pk.bytes)
+                          .decode('utf-8'))
+        self.assertFalse(verificar_assinatura(adulterado))
+        self.assertFalse(verificar_assinatura(dict(dados, evento=str(valido.pk))))
+        with override_settings(SNAPSHOT_SIGNING_KEY='outra-chave'):
+            self.assertFalse(verificar_assinatura(dados))
+
+    def test_delta(self):
+        antigo, validado, removido = self.criar_ingressos(3)
+        removido_id = removido.pk
+        cursor = self.admin_client.get('/api/ingresso/snapshot/').json()['cursor']
+        Ingresso.objects.update(atualizado_em=timezone.now() - timedelta(hours=1))
+        Ingresso.objects.filter(pk=validado.pk).update(utilizado_em=timezone.now(), atualizado_em=timezone.now())
+        removido.delete()
+
+        dados = self.admin_client.get('/api/ingresso/snapshot_delta/', {'cursor': cursor}).json()
+        self.assertTrue(verificar_assinatura(dados))
+        self.assertEqual(self.ids(dados, 'validos'), set())
+        self.assertEqual(self.ids(dados, 'utilizados'), {validado.pk.bytes})
+        self.assertEqual(self.ids(dados, 'removidos'), {removido_id.bytes})
+
+    def test_por_evento(self):
+        evento = Evento.objects.create(nome='Show', data=timezone.now())
+        outro = Evento.objects.create(nome='Outro show', data=timezone.now())
+        lote = Lote.objects.create(evento=evento, nome='Lote', capacidade=10)
+        do_evento, do_outro, removido = self.criar_ingressos(3)
+        Ingresso.objects.filter(pk__in=[do_evento.pk, removido.pk]).update(lote=lote)
+        Ingresso.objects.filter(pk=do_outro.pk).update(lote=Lote.objects.create(evento=outro, nome='Lote',
+                                                                                capacidade=10))
+        cursor = gerar_snapshot()['cursor']
+        Ingresso.objects.get(pk=removido.pk).delete()
+
+        dados = self.admin_client.get('/api/ingresso/snapshot/', {'evento': str(evento.pk)}).json()
+        self.assertEqual(dados['evento'], str(evento.pk))
+        self.assertEqual(self.ids(dados, 'validos'), {do_evento.pk.bytes})
+
+        dados = self.admin_client.get('/api/ingresso/snapshot_delta/', {'cursor': cursor,
+                                                                         'evento': str(outro.pk)}).json()
+        self.assertEqual(self.ids(dados, 'validos'), {do_outro.pk.bytes})
+        self.assertEqual(self.ids(dados, 'removidos'), set())
+
+    def test_exige_chave_exclusiva(self):
+        for chave in ('', settings.SECRET_KEY):
+            with override_settings(SNAPSHOT_SIGNING_KEY=chave), self.assertRaises(ImproperlyConfigured):
+                gerar_snapshot()
+
+
+class QrCodeTest(QueryCountTestCase):
+    texto = 'c27d38ec-76ff-425b-ad52-31575ad06986'
+
+    def setUp(self):
+        super().setUp()
+        reset_qr_code_cache()
+        self.addCleanup(reset_qr_code_cache)
+
+    def test_cache(self):
+        with mock.patch('user.gerar_qrcode.gerar_qr_code', wraps=gerar_qr_code) as gerar:
+            obter_qr_code(self.texto, formato='bits')
+            obter_qr_code(self.texto, formato='bits')
+            obter_qr_code(self.texto, formato='bits', border=2)
+        self.assertEqual(gerar.call_count, 2)
+
+    def test_cache_compartilhado_expira_e_guarda_so_o_padrao(self):
+        config = {'BACKEND': 'user.gerar_qrcode.DjangoQrCodeCache', 'OPTIONS': {'timeout': 60}}
+        with override_settings(QRCODE_CACHE=config), mock.patch.object(cache, 'set', wraps=cache.set) as guardar:
+            reset_qr_code_cache()
+            obter_qr_code(self.texto)
+            obter_qr_code(self.texto, box_size=3)
+            obter_qr_codes([self.texto], formato='svg', border=0)
+        self.assertEqual(guardar.call_count, 1)
+        self.assertEqual(guardar.call_args.kwargs['timeout'], 60)
+
+    def test_formatos(self):
+        png = base64.b64decode(obter_qr_code(self.texto))
+        self.assertTrue(png.startswith(b'\x89PNG'))
+        self.assertTrue(obter_qr_code(self.texto, formato='svg').startswith('<svg'))
+
+        matriz = gerar_qr_code_matriz(self.texto)
+        bits = obter_qr_code(self.texto, formato='bits')
+        self.assertEqual(bits['size'], len(matriz))
+        compactados = base64.b64decode(bits['bits'])
+        modulos = [bool(compactados[i >> 3] & (0x80 >> (i & 7))) for i in range(len(matriz) ** 2)]
+        self.assertEqual(modulos, [modulo for linha in matriz for modulo in linha])
+
+    def test_lote_no_pool_de_processos(self):
+        textos = [str(ingresso.pk) for ingresso in self.criar_ingressos(10)]
+        with override_settings(QRCODE_WORKERS=1):
+            sequencial = gerar_qr_codes_em_lote(textos, formato='svg')
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            self.assertEqual(gerar_qr_codes_em_lote(textos, formato='svg', executor=executor), sequencial)
+
+    def test_precalcular_qrcodes(self):
+        with self.assertRaises(CommandError):
+            call_command('precalcular_qrcodes', stdout=StringIO())
+
+        ingressos = [ingresso.pk for ingresso in self.criar_ingressos(3)]
+        with override_settings(QRCODE_CACHE={'BACKEND': 'user.gerar_qrcode.DjangoQrCodeCache'}):
+            reset_qr_code_cache()
+            call_command('precalcular_qrcodes', formato=['bits'], stdout=StringIO())
+            with mock.patch('user.gerar_qrcode.gerar_qr_codes_em_lote') as gerar:
+                self.assertEqual(len(obter_qr_codes(ingressos, formato='bits')), 3)
+            gerar.assert_not_called()
+
+
+class UserQueryCountTest(QueryCountTestCase):
+
+    def test_list(self):
+        Usuario.objects.bulk_create([
+            Usuario(cpf=i, first_name='Usuario', last_name=str(i), email=f'{i}@ingressou.com')
+            for i in range(1, 21)
+        ])
+        with self.assertMaxQueries(2):
+            response = self.client.get('/api/user/?page_size=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 10)
+        self.assertIsNotNone(response.json()['next'])
+
+
+class IndicesTest(QueryCountTestCase):
+    # Confere no plano de execução que as consultas quentes usam os índices da migração 0012
+
+    def plano(self, queryset):
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Tabelas quase vazias: sem isso o PostgreSQL prefere varrer a tabela
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain()
+
+    def test_meus_ingressos(self):
+        ingressos = Ingresso.objects.filter(usuario=self.usuario)
+        self.assertIn('ingresso_usuario_created_idx', self.plano(ingressos.values_list('pk', flat=True)))
+        # Listagem paginada por cursor
+        self.assertIn('ingresso_usuario_created_idx', self.plano(ingressos.order_by('-created_at', '-id')))
+
+    def test_ingressos_nao_utilizados(self):
+        nao_utilizados = Ingresso.objects.filter(utilizado_em__isnull=True).order_by('created_at', 'id')
+        self.assertIn('ingresso_nao_utilizado_idx', self.plano(nao_utilizados))
+
+    def test_check_ins_por_horario(self):
+        check_ins = Ingresso.objects.filter(utilizado_em__gte=timezone.now() - timedelta(hours=1))
+        self.assertIn('ingresso_utilizado_em_idx', self.plano(check_ins))
+
+
+class UsuarioPaginacaoTest(QueryCountTestCase):
+
+    def test_cadastros_no_mesmo_instante(self):
+        # Importações em lote gravam vários usuários com o mesmo date_joined
+        agora = timezone.now()
+        Usuario.objects.bulk_create([Usuario(cpf=i, date_joined=agora) for i in range(1, 8)])
+        Usuario.objects.update(date_joined=agora)
+
+        cpfs = []
+        pagina = '/api/user/?page_size=2'
+        while pagina:
+            dados = self.client.get(pagina).json()
+            cpfs.extend(usuario['cpf'] for usuario in dados['results'])
+            pagina = dados['next']
+        self.assertEqual(cpfs, sorted(Usuario.objects.values_list('cpf', flat=True)))
+
+
+class PagamentoQueryCountTest(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    def test_atual_em_cache(self):
+        Pagamento.objects.create(chave='pix-antigo', valor=10)
+        Pagamento.objects.create(chave='pix-atual', valor=20)
+        self.client.get('/api/pagamento/atual/')
+        # Só a autenticação vai ao banco
+        with self.assertMaxQueries(1):
+            response = self.client.get('/api/pagamento/atual/')
+        self.assertEqual(response.json()['chave'], 'pix-atual')
+
+    def test_invalida_ao_salvar(self):
+        Pagamento.objects.create(chave='pix-antigo', valor=10)
+        self.client.get('/api/pagamento/atual/')
+        Pagamento.objects.create(chave='pix-novo', valor=20)
+        response = self.client.get('/api/pagamento/atual/')
+        self.assertEqual(response.json()['chave'], 'pix-novo')
+
+
+class CachedTokenAuthenticationTest(QueryCountTestCase):
+
+    def test_autenticacao_em_cache(self):
+        primeiro, segundo = self.criar_ingressos(2)
+        self.admin_client.post('/api/ingresso/validate/', {'ingresso': str(primeiro.pk)}, format='json')
+        # Só o UPDATE condicional vai ao banco
+        with self.assertMaxQueries(1):
+            response = self.admin_client.post('/api/ingresso/validate/', {'ingresso': str(segundo.pk)},
+                                              format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_usuario_desativado(self):
+        self.client.get('/api/ingresso/')
+        self.usuario.is_active = False
+        self.usuario.save()
+        response = self.client.get('/api/ingresso/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_removido(self):
+        self.client.get('/api/ingresso/')
+        TokenAcesso.objects.filter(usuario=self.usuario).delete()
+        response = self.client.get('/api/ingresso/')
+        self.assertEqual(response.status_code, 401)
+
+    def test_invalida_de_novo_no_commit(self):
+        self.client.get('/api/ingresso/')
+        chave = chave_token(TokenAcesso.objects.get(usuario=self.usuario).key)
+        dados = cache.get(chave)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.is_active = False
+            self.usuario.save()
+            # Outro processo lê o token antes do commit e guarda a cópia antiga de volta no cache
+            cache.set(chave, dados)
+        response = self.client.get('/api/ingresso/')
+        self.assertEqual(response.status_code, 401)
+
+
+class TokenAcessoTest(QueryCountTestCase):
+
+    def test_login_rotaciona_tokens(self):
+        cliente = APIClient()
+        with override_settings(TOKEN_MAX_POR_USUARIO=2):
+            tokens = [
+                cliente.post('/api/user/login/', {'cpf': '12345678909', 'password': 'senha'}).json()['token']
+                for _ in range(3)
+            ]
+        self.assertEqual(len(set(tokens)), 3)
+        restantes = set(TokenAcesso.objects.filter(usuario=self.usuario).values_list('key', flat=True))
+        self.assertEqual(restantes, set(tokens[1:]))
+
+    def test_login_formata_expiracao(self):
+        response = APIClient().post('/api/user/login/', {'cpf': '12345678909', 'password': 'senha'})
+        token = TokenAcesso.objects.get(key=response.json()['token'])
+        self.assertEqual(response.json()['expira_em'], timezone.localtime(token.expira_em).strftime('%d/%m/%Y %H:%M:%S'))
+
+    def test_token_descartado_na_rotacao(self):
+        # O token antigo estava em cache: a rotação no login o invalida também lá
+        self.assertEqual(self.client.get('/api/ingresso/').status_code, 200)
+        with override_settings(TOKEN_MAX_POR_USUARIO=1):
+            APIClient().post('/api/user/login/', {'cpf': '12345678909', 'password': 'senha'})
+        self.assertEqual(self.client.get('/api/ingresso/').status_code, 401)
+
+    def test_token_expirado(self):
+        token = TokenAcesso.objects.get(usuario=self.usuario)
+        TokenAcesso.objects.filter(pk=token.pk).update(ultimo_uso=timezone.now() - timedelta(days=365))
+        response = self.client.get('/api/ingresso/')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(TokenAcesso.objects.filter(pk=token.pk).exists())
+
+    def test_ultimo_uso_gravado_com_intervalo(self):
+        token = TokenAcesso.objects.get(usuario=self.usuario)
+        antes = timezone.now() - timedelta(hours=1)
+        TokenAcesso.objects.filter(pk=token.pk).update(ultimo_uso=antes)
+        self.client.get('/api/ingresso/')
+        token.refresh_from_db()
+        self.assertGreater(token.ultimo_uso, antes)
+
+        # Dentro do intervalo de renovação nenhuma escrita é feita
+        with self.assertMaxQueries(1):
+            self.client.get('/api/ingresso/')
+
+    def test_limpar_tokens(self):
+        TokenAcesso.objects.filter(usuario=self.usuario).update(ultimo_uso=timezone.now() - timedelta(days=365))
+        call_command('limpar_tokens', stdout=StringIO())
+        self.assertFalse(TokenAcesso.objects.filter(usuario=self.usuario).exists())
+        self.assertTrue(TokenAcesso.objects.filter(usuario=self.admin).exists())
+
+
+class EsqueciSenhaTest(QueryCountTestCase):
+
+    def test_enfileira_sem_enviar(self):
+        response = APIClient().post('/api/user/esqueci_senha/', {'cpf': '12345678909'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('enviar_emails', stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['fulano@ingressou.com'])
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.status, EmailStatus.ENVIADO)
+        self.assertEqual(email.mensagem, '')
+
+    def test_backoff_em_falha(self):
+        APIClient().post('/api/user/esqueci_senha/', {'cpf': '12345678909'})
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP fora do ar')), \
+                self.assertLogs('user.emails', 'WARNING'):
+            call_command('enviar_emails', stdout=StringIO())
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.status, EmailStatus.PENDENTE)
+        self.assertEqual(email.tentativas, 1)
+        self.assertGreater(email.proxima_tentativa, timezone.now())
+
+    @override_settings(EMAIL_MAX_TENTATIVAS=1)
+    def test_falha_definitiva_apaga_mensagem(self):
+        APIClient().post('/api/user/esqueci_senha/', {'cpf': '12345678909'})
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP fora do ar')), \
+                self.assertLogs('user.emails', 'WARNING'):
+            call_command('enviar_emails', stdout=StringIO())
+        email = EmailPendente.objects.get()
+        self.assertEqual(email.status, EmailStatus.FALHOU)
+        self.assertEqual(email.mensagem, '')
+
+    def test_reservado_durante_o_envio(self):
+        APIClient().post('/api/user/esqueci_senha/', {'cpf': '12345678909'})
+        reservados = []
+
+        def enviar(*args, **kwargs):
+            # Durante o envio o e-mail está reservado: outro worker não o pega de novo
+            reservados.append(enviar_emails_pendentes())
+            return 1
+
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=enviar):
+            self.assertEqual(enviar_emails_pendentes(), 1)
+        self.assertEqual(reservados, [0])
+        self.assertEqual(EmailPendente.objects.get().status, EmailStatus.ENVIADO)
+
+
+class LoginTest(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @override_settings(LOGIN_LIMITE_CPF=3)
+    def test_limite_por_cpf(self):
+        cliente = APIClient()
+        for _ in range(3):
+            response = cliente.post('/api/user/login/', {'cpf': '12345678909', 'password': 'errada'})
+            self.assertEqual(response.status_code, 401)
+
+        with mock.patch('user.login.authenticate') as authenticate:
+            response = cliente.post('/api/user/login/', {'cpf': '12345678909', 'password': 'senha'})
+        self.assertEqual(response.status_code, 429)
+        authenticate.assert_not_called()
+
+        # Outros CPFs do mesmo IP continuam podendo entrar
+        response = cliente.post('/api/user/login/', {'cpf': '98765432100', 'password': 'senha'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(LOGIN_LIMITE_CPF=3)
+    def test_limite_por_cpf_normalizado(self):
+        # Zeros à esquerda, espaços e pontuação não abrem um contador novo para o mesmo usuário
+        cliente = APIClient()
+        for cpf in ('012345678909', ' 12345678909', '123.456.789-09'):
+            response = cliente.post('/api/user/login/', {'cpf': cpf, 'password': 'errada'})
+            self.assertEqual(response.status_code, 401)
+
+        response = cliente.post('/api/user/login/', {'cpf': '12345678909', 'password': 'senha'})
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(LOGIN_LIMITE_IP=2, LOGIN_PROXIES_CONFIAVEIS=1)
+    def test_limite_por_ip_ignora_x_forwarded_for_do_cliente(self):
+        # O cliente pode mandar qualquer coisa no começo do cabeçalho; vale o endereço que o proxy acrescentou
+        cliente = APIClient()
+        for i in range(2):
+            response = cliente.post('/api/user/login/', {'cpf': '12345678909', 'password': 'errada'},
+                                    HTTP_X_FORWARDED_FOR=f'10.0.0.{i}, 203.0.113.7')
+            self.assertEqual(response.status_code, 401)
+
+        response = cliente.post('/api/user/login/', {'cpf': '98765432100', 'password': 'senha'},
+                                HTTP_X_FORWARDED_FOR='10.0.0.99, 203.0.113.7')
+        self.assertEqual(response.status_code, 429)
+
+    def test_rehash_no_login(self):
+        # Hash gravado com um custo menor que o configurado é regravado no login bem-sucedido
+        hasher = TunedPBKDF2PasswordHasher()
+        self.usuario.password = hasher.encode('senha', hasher.salt(), iterations=1000)
+        self.usuario.save()
+
+        response = APIClient().post('/api/user/login/', {'cpf': '12345678909', 'password': 'senha'})
+        self.assertEqual(response.status_code, 200)
+        self.usuario.refresh_from_db()
+        self.assertEqual(hasher.decode(self.usuario.password)['iterations'], hasher.iterations)
+
+
+class AsyncViewsTest(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.token_admin = TokenAcesso.objects.get(usuario=self.admin).key
+        self.token_usuario = TokenAcesso.objects.get(usuario=self.usuario).key
+
+    async def test_validate(self):
+        ingresso = await Ingresso.objects.acreate(usuario=self.usuario, nome='Ingresso', data_nascimento='2000-01-01')
+        headers = {'Authorization': f'Token {self.token_admin}'}
+
+        response = await AsyncClient().post('/api/async/ingresso/validate/', {'ingresso': str(ingresso.pk)},
+                                            content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 200)
+        response = await AsyncClient().post('/api/async/ingresso/validate/', {'ingresso': str(ingresso.pk)},
+                                            content_type='application/json', headers=headers)
+        self.assertEqual(response.status_code, 400)
+
+    async def test_validate_sem_token(self):
+        response = await AsyncClient().post('/api/async/ingresso/validate/', {}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+
+    async def test_meus_ingressos(self):
+        await Ingresso.objects.acreate(usuario=self.usuario, nome='Ingresso', data_nascimento='2000-01-01')
+        response = await AsyncClient().get('/api/async/ingresso/meus_ingressos/', {'formato': 'svg'},
+                                           headers={'Authorization': f'Token {self.token_usuario}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['ingressos'][0].startswith('<svg'))
+
+    async def test_login(self):
+        response = await AsyncClient().post('/api/async/user/login/', {'cpf': '12345678909', 'password': 'senha'},
+                                            content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('token', response.json())
+        token = await TokenAcesso.objects.aget(key=response.json()['token'])
+        self.assertEqual(response.json()['expira_em'],
+                         serializers.DateTimeField().to_representation(token.expira_em))
+
+    @override_settings(LOGIN_LIMITE_CPF=2)
+    async def test_login_limite(self):
+        await sync_to_async(cache.clear)()
+        for _ in range(2):
+            response = await AsyncClient().post('/api/async/user/login/', {'cpf': '12345678909', 'password': 'x'},
+                                                content_type='application/json')
+            self.assertEqual(response.status_code, 401)
+        response = await AsyncClient().post('/api/async/user/login/', {'cpf': '012345678909', 'password': 'senha'},
+                                            content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+    async def test_token_em_cache_sem_banco(self):
+        autenticacao = CachedTokenAuthentication()
+        await sync_to_async(autenticacao.authenticate_credentials)(self.token_usuario)
+        # Token já em cache e renovado há pouco: nem passa pela thread do banco
+        with mock.patch('user.authentication.sync_to_async', wraps=sync_to_async) as adaptador:
+            usuario, _token = await autenticacao.aauthenticate_credentials(self.token_usuario)
+        self.assertEqual(usuario.pk, self.usuario.pk)
+        self.assertEqual([chamada.kwargs for chamada in adaptador.call_args_list], [{'thread_sensitive': False}])
+
+
+class IngressoAdminQueryCountTest(QueryCountTestCase):
+
+    def test_changelist(self):
+        self.criar_ingressos(20)
+        self.admin.is_staff = True
+        self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+        # Sessão, usuário, contagens do changelist e a listagem com JOIN no usuário
+        with self.assertMaxQueries(6):
+            response = self.client.get('/admin/user/ingresso/')
+        self.assertEqual(response.status_code, 200)
+
+
+class BenchmarkTest(TestCase):
+
+    def test_benchmark_api(self):
+        saida = StringIO()
+        call_command('benchmark_api', usuarios=3, requisicoes=2, login=1, json=True, stdout=saida)
+        resultados = json.loads(saida.getvalue())['resultados']
+        self.assertLessEqual({'login', 'payment', 'meus_ingressos', 'validate', 'user_list'}, set(resultados))
+        # Os dados populados são desfeitos ao final
+        self.assertFalse(Usuario.objects.exists())
+
+    def test_comparar(self):
+        anterior = {'validate': {'p50_ms': 1.0}, 'login': {'p50_ms': 100.0}}
+        atual = {'validate': {'p50_ms': 1.5}, 'login': {'p50_ms': 105.0}, 'payment': {'p50_ms': 5.0}}
+        self.assertEqual(comparar(atual, anterior, tolerancia=20), {'validate': 50.0})
+
+
+class MetricasTest(QueryCountTestCase):
+
+    def setUp(self):
+        super().setUp()
+        limpar_metricas()
+
+    def test_server_timing(self):
+        self.criar_ingressos(1)
+        response = self.client.get('/api/ingresso/meus_ingressos/')
+        self.assertEqual(response.status_code, 200)
+        server_timing = response['Server-Timing']
+        for componente in ('auth', 'ingresso_meus_ingressos', 'qrcode_lote', 'db', 'total', 'queries'):
+            self.assertIn(componente, server_timing)
+
+        with self.settings(METRICAS_TOKEN='segredo'):
+            metricas = APIClient().get('/metrics/', HTTP_AUTHORIZATION='Bearer segredo').content.decode()
+        self.assertIn('ingressou_request_duration_seconds_count{endpoint="ingresso-meus-ingressos"} 1', metricas)
+        self.assertIn('ingressou_component_duration_seconds_count{componente="ingresso_meus_ingressos"} 1', metricas)
+        self.assertIn('ingressou_response_size_bytes_bucket{endpoint="ingresso-meus-ingressos",le="+Inf"} 1',
+                      metricas)
+
+    @override_settings(METRICAS_TOKEN='segredo')
+    def test_metricas_com_token(self):
+        self.assertEqual(APIClient().get('/metrics/').status_code, 403)
+        response = APIClient().get('/metrics/', HTTP_AUTHORIZATION='Bearer segredo')
+        self.assertEqual(response.status_code, 200)
+
+    def test_metricas_sem_token_configurado(self):
+        self.assertEqual(APIClient().get('/metrics/').status_code, 404)
+
+    async def test_server_timing_async(self):
+        # Sob ASGI o middleware roda no event loop e conta as queries feitas nas threads do sync_to_async
+        token = await TokenAcesso.objects.filter(usuario=self.usuario).values_list('key', flat=True).aget()
+        self.assertTrue(iscoroutinefunction(MetricasMiddleware(AsyncClient().handler.get_response_async)))
+        response = await AsyncClient().get('/api/async/ingresso/meus_ingressos/',
+                                           headers={'Authorization': f'Token {token}'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('queries;desc="0"', response['Server-Timing'])
+
+
+class EstoqueTest(QueryCountTestCase):
+    ingresso = {'nome': 'Ciclano', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}
+
+    def setUp(self):
+        super().setUp()
+        evento = Evento.objects.create(nome='Show', data=timezone.now())
+        self.lote = Lote.objects.create(evento=evento, nome='Primeiro lote', capacidade=3)
+        Pagamento.objects.create(chave='chave', valor=Decimal('10.00'))
+
+    def comprar(self, quantidade, **dados):
+        return self.client.post('/api/ingresso/payment/', {'ingressos': [self.ingresso] * quantidade, **dados},
+                                format='json')
+
+    def test_nao_vende_alem_da_capacidade(self):
+        # Mesmas queries da compra sem lote, trocando a consulta aos lotes pelo UPDATE condicional do estoque
+        with self.assertMaxQueries(7):
+            response = self.comprar(2, lote=str(self.lote.pk))
+        self.assertEqual(response.status_code, 201)
+
+        response = self.comprar(2, lote=str(self.lote.pk))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'lote': ['Lote esgotado.']})
+
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.disponivel, 1)
+        self.assertEqual(self.lote.ingressos.count(), 2)
+
+    def test_compra_sem_lote_depois_de_cadastrados(self):
+        response = self.comprar(2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'lote': ['Informe o lote ou a reserva.']})
+        self.assertFalse(Ingresso.objects.exists())
+
+    @override_settings(RESERVA_MAXIMO_POR_USUARIO=2)
+    def test_limite_de_reservas_por_usuario(self):
+        self.lote.capacidade = 10
+        self.lote.save()
+        response = self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 2})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 1})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('quantidade', response.json())
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.disponivel, 8)
+
+        # Reservas vencidas não contam
+        Reserva.objects.update(expira_em=timezone.now())
+        response = self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 2})
+        self.assertEqual(response.status_code, 201)
+
+    def test_reserva(self):
+        response = self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 2})
+        self.assertEqual(response.status_code, 201)
+        reserva = response.json()['id']
+        self.assertEqual(self.comprar(2, lote=str(self.lote.pk)).status_code, 400)
+
+        # Compra menor que a reserva: a sobra volta ao estoque
+        self.assertEqual(self.comprar(1, reserva=reserva).status_code, 201)
+        self.assertEqual(self.comprar(1, reserva=reserva).status_code, 400)
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.disponivel, 2)
+
+    def test_reserva_vencida_volta_ao_estoque(self):
+        self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 3})
+        reserva = Reserva.objects.get()
+        self.assertEqual(self.comprar(1, reserva=str(reserva.pk)).status_code, 201)
+
+        self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 2})
+        Reserva.objects.filter(status=ReservaStatus.ATIVA).update(expira_em=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.comprar(2, lote=str(self.lote.pk)).status_code, 201)
+        self.assertFalse(Reserva.objects.filter(status=ReservaStatus.ATIVA).exists())
+
+    def test_alterar_capacidade_no_admin(self):
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+        self.assertEqual(self.comprar(2, lote=str(self.lote.pk)).status_code, 201)
+        url = f'/admin/user/lote/{self.lote.pk}/change/'
+        dados = {'evento': str(self.lote.evento_id), 'nome': 'Primeiro lote'}
+
+        response = self.client.post(url, {**dados, 'capacidade': 10})
+        self.assertEqual(response.status_code, 302)
+        self.lote.refresh_from_db()
+        self.assertEqual((self.lote.capacidade, self.lote.disponivel), (10, 8))
+
+        # Abaixo dos 2 já vendidos: erro no formulário, sem tocar no estoque
+        response = self.client.post(url, {**dados, 'capacidade': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('capacidade', response.context['adminform'].form.errors)
+        response = self.client.post(url, {**dados, 'capacidade': 2})
+        self.assertEqual(response.status_code, 302)
+        self.lote.refresh_from_db()
+        self.assertEqual((self.lote.capacidade, self.lote.disponivel), (2, 0))
+
+    def test_alterar_capacidade_nao_regrava_disponivel(self):
+        # A instância foi lida antes da venda: o disponível dela já está desatualizado
+        lote = Lote.objects.get(pk=self.lote.pk)
+        self.assertEqual(self.comprar(1, lote=str(self.lote.pk)).status_code, 201)
+        lote.capacidade = 5
+        lote.save()
+        self.assertEqual(lote.disponivel, 4)
+        lote.refresh_from_db()
+        self.assertEqual(lote.disponivel, 4)
+
+    def test_liberar_reservas(self):
+        self.client.post('/api/ingresso/reservar/', {'lote': str(self.lote.pk), 'quantidade': 3})
+        Reserva.objects.update(expira_em=timezone.now() - timedelta(seconds=1))
+        call_command('liberar_reservas', stdout=StringIO())
+        self.lote.refresh_from_db()
+        self.assertEqual(self.lote.disponivel, 3)
+        self.assertEqual(Reserva.objects.get().status, ReservaStatus.EXPIRADA)
+
+
+class IdempotenciaTest(QueryCountTestCase):
+    compra = {'ingressos': [{'nome': 'Ciclano', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}] * 2}
+
+    def setUp(self):
+        super().setUp()
+        Pagamento.objects.create(chave='chave', valor=Decimal('10.00'))
+
+    def comprar(self, compra=None, chave='compra-1'):
+        return self.client.post('/api/ingresso/payment/', compra or self.compra, format='json',
+                                HTTP_IDEMPOTENCY_KEY=chave)
+
+    def test_repeticao_devolve_resposta_gravada(self):
+        primeira = self.comprar()
+        self.assertEqual(primeira.status_code, 201)
+
+        # Abertura e fim da transação, INSERT recusado pela chave única (dentro de um savepoint) e a
+        # leitura da resposta gravada
+        with self.assertMaxQueries(7):
+            repeticao = self.comprar()
+        self.assertEqual(repeticao.status_code, 201)
+        self.assertEqual(repeticao['Idempotent-Replayed'], 'true')
+        self.assertEqual(repeticao.json(), primeira.json())
+        self.assertEqual(Ingresso.objects.count(), 2)
+
+    def test_chave_com_outra_requisicao(self):
+        self.comprar()
+        compra = {'ingressos': self.compra['ingressos'][:1]}
+        self.assertEqual(self.comprar(compra).status_code, 422)
+        self.assertEqual(self.comprar(compra, chave='compra-2').status_code, 201)
+
+    def test_chave_processando_nao_e_reaproveitada(self):
+        # Gravada em outra transação (versão anterior): não é retomada só porque o tempo passou
+        ChaveIdempotencia.objects.create(usuario=self.usuario, chave='compra-1', rota='ingresso-payment',
+                                         hash_requisicao='x', created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(self.comprar().status_code, 409)
+        self.assertFalse(Ingresso.objects.exists())
+
+    def test_falha_no_meio_da_compra_desfaz_tudo(self):
+        with mock.patch('user.apis.viewsets.IngressoSerializer', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.comprar()
+        # Ingressos, pedido e chave voltam juntos: a repetição compra uma única vez
+        self.assertFalse(Ingresso.objects.exists())
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+        self.assertEqual(self.comprar().status_code, 201)
+        self.assertEqual(self.comprar().status_code, 201)
+        self.assertEqual(Ingresso.objects.count(), 2)
+        self.assertEqual(Pedido.objects.count(), 1)
+
+    def test_erro_nao_grava_chave(self):
+        self.assertEqual(self.comprar({'ingressos': []}).status_code, 400)
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+        self.assertEqual(self.comprar().status_code, 201)
+
+    def test_limpar_idempotencia(self):
+        self.comprar()
+        ChaveIdempotencia.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('limpar_idempotencia', stdout=StringIO())
+        self.assertFalse(ChaveIdempotencia.objects.exists())
+
+
+class ConciliacaoTest(QueryCountTestCase):
+    ingresso = {'nome': 'Ciclano', 'data_nascimento': '01/01/2000', 'situacao': 'SOLTEIRO'}
+
+    def setUp(self):
+        super().setUp()
+        Pagamento.objects.create(chave='pix@ingressou.com', valor=Decimal('25.00'))
+
+    def test_compra_gera_pedido(self):
+        response = self.client.post('/api/ingresso/payment/', {'ingressos': [self.ingresso] * 2}, format='json')
+        pedido = Pedido.objects.get()
+        self.assertEqual(pedido.valor, Decimal('50.00'))
+        self.assertEqual({ingresso['pedido'] for ingresso in response.json()}, {str(pedido.pk)})
+
+        pedidos = self.client.get('/api/pedido/').json()['results']
+        self.assertEqual(pedidos[0]['txid'], pedido.txid)
+        self.assertEqual(pedidos[0]['chave_pix'], 'pix@ingressou.com')
+
+    def test_conciliar(self):
+        pedidos = Pedido.objects.bulk_create([Pedido(usuario=self.usuario, valor=Decimal('25.00')) for _ in range(3)])
+        extrato = [
+            {'txid': pedidos[0].txid, 'valor': '25.00', 'horario': '2026-01-01T12:00:00-03:00'},
+            {'txid': pedidos[1].txid, 'valor': '20.00', 'horario': '2026-01-01T12:01:00-03:00'},
+            {'txid': pedidos[0].txid, 'valor': '25.00', 'horario': '2026-01-01T12:00:00-03:00'},
+            {'txid': 'desconhecido', 'valor': '10.00', 'horario': '2026-01-01T12:02:00-03:00'},
+            {'txid': '', 'valor': '10.00'},
+        ]
+        # A quantidade de queries não depende do tamanho do lote
+        with self.assertMaxQueries(8):
+            resultado = conciliar(extrato)
+        self.assertEqual(resultado, {'lidos': 5, 'pagos': 1, 'divergentes': 1, 'sem_pedido': 1,
+                                     'duplicados': 1, 'invalidos': 1})
+
+        pago, divergente, aguardando = [Pedido.objects.get(pk=pedido.pk) for pedido in pedidos]
+        self.assertEqual(pago.status, PedidoStatus.PAGO)
+        self.assertEqual(pago.pago_em.isoformat(), '2026-01-01T15:00:00+00:00')
+        self.assertEqual((divergente.status, divergente.valor_pago), (PedidoStatus.DIVERGENTE, Decimal('20.00')))
+        self.assertEqual(aguardando.status, PedidoStatus.AGUARDANDO)
+
+        # Reprocessar o mesmo extrato não altera nada
+        self.assertEqual(conciliar(extrato)['pagos'], 0)
+        self.assertEqual(LancamentoPix.objects.count(), 3)
+
+    def test_conciliar_linhas_malformadas(self):
+        pedido = Pedido.objects.create(usuario=self.usuario, valor=Decimal('25.00'))
+        extrato = [
+            {'txid': 'x' * 36, 'valor': '25.00'},
+            {'txid': 'nan', 'valor': 'NaN'},
+            {'txid': 'infinito', 'valor': 'Infinity'},
+            {'txid': 'negativo', 'valor': '-25.00'},
+            {'txid': 'grande', 'valor': '100000000.00'},
+            {'txid': 'centavos', 'valor': '25.001'},
+            {'txid': 'horario', 'valor': '25.00', 'horario': '2026-13-01T12:00:00Z'},
+            {'txid': pedido.txid, 'valor': '25.00', 'horario': '2026-01-01T12:00:00Z'},
+        ]
+        # As linhas que o banco recusaria não derrubam o lote: só elas ficam de fora
+        resultado = conciliar(extrato)
+        self.assertEqual((resultado['invalidos'], resultado['pagos']), (7, 1))
+        self.assertEqual(LancamentoPix.objects.count(), 1)
+
+    def test_compra_usa_o_preco_do_banco(self):
+        # Outro processo mudou o preço e este ainda tem o antigo no cache
+        self.client.get('/api/pagamento/atual/')
+        with mock.patch('user.signals.invalidar_pagamento_atual'):
+            Pagamento.objects.create(chave='pix-novo', valor=Decimal('30.00'))
+        self.assertEqual(self.client.get('/api/pagamento/atual/').json()['valor'], '25.00')
+
+        self.client.post('/api/ingresso/payment/', {'ingressos': [self.ingresso]}, format='json')
+        self.assertEqual(Pedido.objects.get().valor, Decimal('30.00'))
+
+    def test_conciliar_pix_jsonl(self):
+        pedido = Pedido.objects.create(usuario=self.usuario, valor=Decimal('25.00'))
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl') as arquivo:
+            arquivo.write(json.dumps({'txid': pedido.txid, 'valor': 25, 'horario': '2026-01-01T12:00:00Z'}) + '\n')
+            arquivo.flush()
+            call_command('conciliar_pix', arquivo.name, stdout=StringIO())
+        pedido.refresh_from_db()
+        self.assertEqual(pedido.status, PedidoStatus.PAGO)
+
+
+class ImportarUsuariosTest(QueryCountTestCase):
+
+    def test_importar_usuarios(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv') as arquivo:
+            arquivo.write(
+                "cpf,first_name,last_name,email,birthday\n"
+                "111.444.777-35,Maria,Souza,Maria@Ingressou.com,01/02/1990\n"
+                "11144477735,Maria,Repetida,,\n"
+                "12345678909,Já,Cadastrado,,\n"
+                "abc,Inválido,,,\n"
+                "52998224725,Outra,Pessoa,maria@ingressou.com,\n"
+                "39053344705,José,,,1990-02-01\n"
+            )
+            arquivo.flush()
+            saida = StringIO()
+            call_command('importar_usuarios', arquivo.name, stdout=saida)
+        self.assertIn('2 usuários importados', saida.getvalue())
+        self.assertIn('1 já cadastrados, 2 duplicados no arquivo, 1 inválidos', saida.getvalue())
+
+        maria = Usuario.objects.get(cpf=11144477735)
+        self.assertEqual((maria.email, str(maria.birthday)), ('maria@ingressou.com', '1990-02-01'))
+        self.assertTrue(maria.is_primeiro_acesso)
+        self.assertFalse(maria.has_usable_password())
+
+        response = APIClient().post('/api/user/primeiro_acesso/', {
+            'cpf': '39053344705', 'password': 'nova-senha', 'email': 'jose@ingressou.com',
+        })
+        self.assertEqual(response.status_code, 200)
+
+    def test_email_cadastrado_com_maiusculas(self):
+        Usuario.objects.create_user(password='senha', cpf=52998224725, email='Maria@Ingressou.com')
+        resultado = importar_usuarios([{'cpf': '11144477735', 'email': 'maria@ingressou.com'}])
+        self.assertEqual((resultado['importados'], resultado['existentes']), (0, 1))
+        self.assertFalse(Usuario.objects.filter(cpf=11144477735).exists())
+
+    def test_cadastro_concorrente_nao_interrompe(self):
+        # Um usuário se cadastra entre a consulta aos existentes e o INSERT do lote
+        def cadastrar_no_meio(senha=senha_inutilizavel):
+            if not Usuario.objects.filter(cpf=11144477735).exists():
+                Usuario.objects.create_user(password='senha', cpf=11144477735)
+            return senha()
+
+        linhas = [{'cpf': '11144477735'}, {'cpf': '39053344705'}]
+        with mock.patch('user.importacao.senha_inutilizavel', side_effect=cadastrar_no_meio):
+            resultado = importar_usuarios(linhas)
+        self.assertEqual((resultado['importados'], resultado['existentes']), (1, 1))
+        self.assertTrue(Usuario.objects.get(cpf=11144477735).has_usable_password())
+
+        # Reimportar o mesmo arquivo não duplica ninguém
+        resultado = importar_usuarios(linhas)
+        self.assertEqual((resultado['importados'], resultado['existentes']), (0, 2))
+
+
+class ValidateCpfTest(QueryCountTestCase):
+
+    def test_consulta_em_cache(self):
+        cliente = APIClient()
+        response = cliente.get('/api/user/validate_cpf/12345678909/')
+        self.assertEqual(response.json(), {'primeiro_acesso': True})
+        with self.assertMaxQueries(0):
+            response = cliente.get('/api/user/validate_cpf/12345678909/')
+        self.assertEqual(response.json(), {'primeiro_acesso': True})
+
+    def test_cpf_inexistente_em_cache(self):
+        cliente = APIClient()
+        self.assertEqual(cliente.get('/api/user/validate_cpf/11144477735/').status_code, 404)
+        with self.assertMaxQueries(0):
+            self.assertEqual(cliente.get('/api/user/validate_cpf/11144477735/').status_code, 404)
+
+        # O cadastro remove a entrada negativa
+        Usuario.objects.create_user(password='senha', cpf=11144477735)
+        self.assertEqual(cliente.get('/api/user/validate_cpf/11144477735/').status_code, 200)
+
+    def test_cpf_malformado_sem_consulta(self):
+        for cpf in ('123456789012', 'abc'):
+            with self.assertMaxQueries(0):
+                response = APIClient().get(f'/api/user/validate_cpf/{cpf}/')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'cpf': ['CPF inválido.']})
+
+    def test_cpf_invalido(self):
+        for cpf in ('12345678900', '11111111111'):
+            response = APIClient().get(f'/api/user/validate_cpf/{cpf}/')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.json(), {'cpf': ['CPF inválido.']})
+
+        # Usuário antigo, cadastrado antes da verificação dos dígitos, continua passando pela tela de login
+        Usuario.objects.bulk_create([Usuario(cpf=11144477700, password='!')])
+        response = APIClient().get('/api/user/validate_cpf/11144477700/')
+        self.assertEqual(response.json(), {'primeiro_acesso': True})
+
+    def test_cadastro_com_cpf_invalido(self):
+        with self.assertRaises(ValidationError):
+            Usuario.objects.create_user(password='senha', cpf=12345678900)
+        response = self.admin_client.post('/api/user/', {
+            'cpf': 12345678900, 'first_name': 'Fulano', 'last_name': 'Silva', 'email': 'outro@ingressou.com',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cpf', response.json())
+        self.assertFalse(Usuario.objects.filter(cpf=12345678900).exists())
+
+    def test_create_user_com_cpf_em_texto(self):
+        usuario = Usuario.objects.create_user(password='senha', cpf='52998224725')
+        self.assertEqual(usuario.cpf, 52998224725)
+        for cpf in ('abc', None):
+            with self.assertRaises(ValidationError):
+                Usuario.objects.create_user(password='senha', cpf=cpf)
+
+    def test_usuario_antigo_continua_editavel(self):
+        antigo = Usuario.objects.create(cpf=11144477700, email='antigo@ingressou.com', password='!')
+        dados = {'cpf': 11144477700, 'first_name': 'Antigo', 'last_name': 'Silva', 'email': 'antigo@ingressou.com'}
+        response = self.admin_client.put(f'/api/user/{antigo.pk}/', dados)
+        self.assertEqual(response.status_code, 200)
+        # Trocar por outro CPF inválido continua recusado
+        response = self.admin_client.put(f'/api/user/{antigo.pk}/', {**dados, 'cpf': 12345678900})
+        self.assertEqual(response.status_code, 400)
+
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+        response = self.client.post(f'/admin/user/usuario/{antigo.pk}/change/', {
+            'cpf': 11144477700, 'email': 'antigo@ingressou.com', 'tipo': UserType.COMUM, 'password': antigo.password,
+            'date_joined_0': '01/01/2024', 'date_joined_1': '00:00:00',
+        })
+        self.assertEqual(response.status_code, 302)
+        antigo.refresh_from_db()
+        self.assertFalse(antigo.is_active)
+
+    def test_invalidado_ao_definir_senha(self):
+        cliente = APIClient()
+        cliente.get('/api/user/validate_cpf/12345678909/')
+        cliente.post('/api/user/primeiro_acesso/', {
+            'cpf': '12345678909', 'password': 'nova-senha', 'email': 'fulano@ingressou.com',
+        })
+        self.assertEqual(cliente.get('/api/user/validate_cpf/12345678909/').json(), {'primeiro_acesso': False})
+
+        cliente.post('/api/user/esqueci_senha/', {'cpf': '12345678909'})
+        self.assertEqual(cliente.get('/api/user/validate_cpf/12345678909/').json(), {'primeiro_acesso': True})